@@ -0,0 +1,140 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# benchmark of ``hashtag_replacer``: the old per-word ``re.sub`` (with not
+# compiled pattern and new closure for each word) against one-pass
+# ``HashtagReplacer.replace_cell()``.
+#
+#   $ python3 -m benchmarks.bench_hashtag_replacer
+
+assert str is not bytes
+
+import re, time, argparse
+from lib_make_world_news_2013_02_12 import hashtag_replacer
+from . import corpus
+
+class LegacyHashtagReplacer:
+    # implementation, which was used before ``replace_cell()``
+    
+    def __init__(self, hashtag_set):
+        self._hashtag_set = hashtag_set
+        self._used = set()
+    
+    def __call__(self, word):
+        def replace_func(matchobj):
+            word_lower = matchobj.group('word').lower()
+            
+            if matchobj.group('pre_word').endswith('#'):
+                self._used.add(word_lower)
+                
+                return matchobj.group()
+            
+            if word_lower in self._hashtag_set and \
+                    word_lower not in self._used:
+                self._used.add(word_lower)
+                
+                return '{}#{}{}'.format(
+                        matchobj.group('pre_word'),
+                        matchobj.group('word'),
+                        matchobj.group('post_word'),
+                        )
+            
+            return matchobj.group()
+        
+        return re.sub(
+                r'^(?P<pre_word>\W*?)(?P<word>\w+?)(?P<post_word>\W*?)$',
+                replace_func,
+                word,
+                flags=re.M | re.S,
+                )
+
+def is_url(word):
+    return word.startswith('https://') or word.startswith('http://')
+
+def run_per_word(msg_list, replacer_factory):
+    result_list = []
+    
+    for msg in msg_list:
+        replacer = replacer_factory()
+        result_list.append('|'.join(
+                ' '.join(
+                        word if is_url(word) else replacer(word)
+                        for word in cell.split(' ')
+                        )
+                for cell in msg.split('|')
+                ))
+    
+    return result_list
+
+def run_per_cell(msg_list, replacer_factory):
+    result_list = []
+    
+    for msg in msg_list:
+        replacer = replacer_factory()
+        result_list.append('|'.join(
+                replacer.replace_cell(cell)
+                for cell in msg.split('|')
+                ))
+    
+    return result_list
+
+def measure(func, *args, repeat=None):
+    if repeat is None:
+        repeat = 3
+    
+    best = None
+    
+    for i in range(repeat):
+        t = time.perf_counter()
+        result = func(*args)
+        t = time.perf_counter() - t
+        
+        if best is None or t < best:
+            best = t
+    
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='benchmark of hashtag replacement',
+            )
+    corpus.add_corpus_arguments(parser)
+    args = parser.parse_args()
+    
+    msg_list = corpus.create_message_list(**corpus.get_corpus_kwargs(args))
+    hashtag_set = hashtag_replacer.create_hashtag_set(corpus.HASHTAG_LIST)
+    
+    legacy_time, legacy_result = measure(
+            run_per_word, msg_list, lambda: LegacyHashtagReplacer(hashtag_set))
+    word_time, word_result = measure(
+            run_per_word, msg_list, lambda: hashtag_replacer.HashtagReplacer(hashtag_set))
+    cell_time, cell_result = measure(
+            run_per_cell, msg_list, lambda: hashtag_replacer.HashtagReplacer(hashtag_set))
+    
+    if word_result != legacy_result or cell_result != legacy_result:
+        raise AssertionError('results are different')
+    
+    for name, t in (
+            ('legacy per-word re.sub', legacy_time),
+            ('compiled per-word', word_time),
+            ('one-pass per-cell', cell_time),
+            ):
+        print('{:<24} {:8.3f} s  {:10.0f} msg/s  x{:.2f}'.format(
+                name, t, len(msg_list) / t, legacy_time / t))
+
+if __name__ == '__main__':
+    main()
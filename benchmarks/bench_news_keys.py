@@ -0,0 +1,139 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# benchmark of news keys: the old per-url ``hmac.new()`` (key padding and
+# inner/outer setup for each url) against ``MessageTransformer`` with HMAC
+# states prepared once, per url and by one ``get_news_keys()`` call. also
+# long mode of whole messages: per-message ``transform()`` against chunks
+# of ``transform_many()``.
+#
+#   $ python3 -m benchmarks.bench_news_keys
+
+assert str is not bytes
+
+import base64, argparse
+from lib_make_world_news_2013_02_12 import make_world_news, message_transformer
+from . import corpus
+from .bench_hashtag_replacer import measure
+
+SITE_URL = 'http://world-news.example.org/'
+NEWS_SECRET_KEY = b'uwOBW2mWcssuYWFN69w+E0LQaMIxefqDZPZJhJffIKM='
+DEFAULT_CHUNK_SIZE = 100
+
+def get_url_list(msg_list):
+    return [
+            word
+            for msg in msg_list
+            for word in msg.replace('|', ' ').split(' ')
+            if word.startswith('https://') or word.startswith('http://')
+            ]
+
+def run_legacy(url_list):
+    result_list = []
+    
+    for url in url_list:
+        news_key = make_world_news.get_news_key(url, NEWS_SECRET_KEY)
+        result_list.append((news_key, base64.b64encode(news_key).decode()))
+    
+    return result_list
+
+def run_per_url(url_list, transformer):
+    result_list = []
+    
+    for url in url_list:
+        news_key = transformer.get_news_key(url)
+        result_list.append((news_key, base64.b64encode(news_key).decode()))
+    
+    return result_list
+
+def run_batch(url_list, transformer):
+    return transformer.get_news_keys(url_list)
+
+def run_transform(msg_list, transformer):
+    return [transformer.transform(msg) for msg in msg_list]
+
+def run_transform_many(msg_list, transformer, chunk_size):
+    result_list = []
+    
+    for chunk_i in range(0, len(msg_list), chunk_size):
+        for result, e in transformer.transform_many(
+                msg_list[chunk_i:chunk_i + chunk_size]):
+            if e is not None:
+                raise e
+            
+            result_list.append(result)
+    
+    return result_list
+
+def print_result_list(title, result_list, count, unit):
+    print(title)
+    
+    base_time = result_list[0][1]
+    
+    for name, t in result_list:
+        print('  {:<30} {:8.3f} s  {:10.0f} {}/s  x{:.2f}'.format(
+                name, t, count / t, unit, base_time / t))
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='benchmark of news keys (HMAC) in long link mode',
+            )
+    corpus.add_corpus_arguments(parser)
+    parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='messages per one transform_many() call. default is {}'.format(
+                    DEFAULT_CHUNK_SIZE),
+            )
+    args = parser.parse_args()
+    
+    msg_list = corpus.create_message_list(**corpus.get_corpus_kwargs(args))
+    url_list = get_url_list(msg_list)
+    transformer = message_transformer.MessageTransformer(SITE_URL, NEWS_SECRET_KEY)
+    
+    legacy_time, legacy_result = measure(run_legacy, url_list)
+    per_url_time, per_url_result = measure(run_per_url, url_list, transformer)
+    batch_time, batch_result = measure(run_batch, url_list, transformer)
+    
+    if per_url_result != legacy_result or batch_result != legacy_result:
+        raise AssertionError('news keys are different')
+    
+    print_result_list('news keys', (
+            ('legacy per-url hmac.new', legacy_time),
+            ('prepared state, per-url', per_url_time),
+            ('prepared state, batch', batch_time),
+            ), len(url_list), 'url')
+    
+    # without memo: every url is hashed, as with unique urls
+    transformer = message_transformer.MessageTransformer(SITE_URL, NEWS_SECRET_KEY)
+    
+    transform_time, transform_result = measure(
+            run_transform, msg_list, transformer)
+    many_time, many_result = measure(
+            run_transform_many, msg_list, transformer, args.chunk_size)
+    
+    if many_result != transform_result:
+        raise AssertionError('results are different')
+    
+    print_result_list('long mode messages', (
+            ('per-message transform', transform_time),
+            ('chunks of transform_many', many_time),
+            ), len(msg_list), 'msg')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# check of ``http_pool.HttpPool.abort()``: requests, which are stuck in
+# connect (listener with full backlog, like not reachable host) or wait for
+# response, must return at once, not after their timeout. exit status is
+# not zero, if they do not.
+#
+#   $ python3 -m benchmarks.check_abort
+
+assert str is not bytes
+
+import sys, socket, threading, time
+from lib_make_world_news_2013_02_12 import http_pool
+
+REQUEST_TIMEOUT = 8.0 # seconds
+ABORT_DELAY = 0.5 # seconds
+MAX_ABORT_SECONDS = 1.0
+
+def fill_backlog(port):
+    # returns sockets, which fill backlog of listener. next connects hang
+    
+    fill_list = []
+    
+    while len(fill_list) < 100:
+        sock = socket.socket()
+        sock.settimeout(ABORT_DELAY)
+        
+        try:
+            sock.connect(('127.0.0.1', port))
+        except OSError:
+            sock.close()
+            
+            return fill_list
+        
+        fill_list.append(sock)
+    
+    raise RuntimeError('backlog of listener is not filled')
+
+def check_stuck_request(name, port):
+    pool = http_pool.HttpPool()
+    result_list = []
+    
+    def request():
+        try:
+            pool.request('GET', 'http://127.0.0.1:{}/'.format(port),
+                    timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            result_list.append(e)
+        else:
+            result_list.append(None)
+    
+    thread = threading.Thread(target=request)
+    thread.start()
+    time.sleep(ABORT_DELAY)
+    
+    start_time = time.monotonic()
+    pool.abort()
+    thread.join()
+    abort_seconds = time.monotonic() - start_time
+    
+    ok = abort_seconds < MAX_ABORT_SECONDS and \
+            isinstance(result_list[0], http_pool.Aborted)
+    print('{}: returned after abort in {:.2f} s: {!r}: {}'.format(
+            name, abort_seconds, result_list[0], 'ok' if ok else 'FAILED'))
+    
+    return ok
+
+def main():
+    # listener, which does not accept: connects hang after its backlog is
+    # full
+    connect_srv = socket.socket()
+    connect_srv.bind(('127.0.0.1', 0))
+    connect_srv.listen(0)
+    fill_list = fill_backlog(connect_srv.getsockname()[1])
+    
+    # listener, which accepts, but does not respond
+    response_srv = socket.socket()
+    response_srv.bind(('127.0.0.1', 0))
+    response_srv.listen(10)
+    
+    ok = check_stuck_request('stuck connect', connect_srv.getsockname()[1])
+    ok = check_stuck_request('stuck response', response_srv.getsockname()[1]) and ok
+    
+    for sock in fill_list:
+        sock.close()
+    
+    connect_srv.close()
+    response_srv.close()
+    
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
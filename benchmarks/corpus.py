@@ -0,0 +1,203 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# synthetic corpus of input news messages.
+#
+#   $ python3 -m benchmarks.corpus --messages 100000 messages.txt
+
+assert str is not bytes
+
+import random, argparse
+
+DEFAULT_MESSAGES = 10000
+DEFAULT_URLS_PER_MSG = 2
+DEFAULT_CELLS_PER_MSG = 2
+DEFAULT_WORDS_PER_CELL = 10
+DEFAULT_HASHTAG_DENSITY = 0.1
+DEFAULT_URL_REPEAT = 0.2
+
+WORD_LIST = (
+        'the', 'of', 'today', 'president', 'says', 'market', 'city',
+        'police', 'report', 'new', 'law', 'government', 'film', 'art',
+        'about', 'after', 'before', 'people', 'year', 'week',
+        )
+HASHTAG_LIST = (
+        'news', 'world', 'election', 'economy', 'football', 'storm',
+        'science', 'health', 'music', 'tech', 'Moscow', 'London',
+        )
+PUNCT_LIST = (',', '.', '!', ':', '(', ')', '"', '#')
+HOST_LIST = (
+        'example.com', 'www.example.org', 'news.example.net',
+        'www.example.info', 'blog.example.com',
+        )
+
+def create_url(rnd):
+    return '{}://{}/{}/{}{}'.format(
+            rnd.choice(('http', 'http', 'https')),
+            rnd.choice(HOST_LIST),
+            rnd.choice(WORD_LIST),
+            rnd.randint(0, 1000000000),
+            '?id={}'.format(rnd.randint(0, 1000)) if rnd.random() < 0.3 else '',
+            )
+
+def create_word(rnd, hashtag_density):
+    if rnd.random() < hashtag_density:
+        word = rnd.choice(HASHTAG_LIST)
+    else:
+        word = rnd.choice(WORD_LIST)
+    
+    if rnd.random() < 0.2:
+        word = word.title()
+    if rnd.random() < 0.05:
+        word = '{}{}'.format(rnd.choice(PUNCT_LIST), word)
+    if rnd.random() < 0.1:
+        word = '{}{}'.format(word, rnd.choice(PUNCT_LIST))
+    
+    return word
+
+def create_message_list(count=None, urls_per_msg=None, cells_per_msg=None,
+        words_per_cell=None, hashtag_density=None, url_repeat=None, seed=None):
+    # ``url_repeat`` is part of urls (``0.0 .. 1.0``), which repeat one of
+    # urls seen before (news lists repeat the same source url often)
+    
+    if count is None:
+        count = DEFAULT_MESSAGES
+    if urls_per_msg is None:
+        urls_per_msg = DEFAULT_URLS_PER_MSG
+    if cells_per_msg is None:
+        cells_per_msg = DEFAULT_CELLS_PER_MSG
+    if words_per_cell is None:
+        words_per_cell = DEFAULT_WORDS_PER_CELL
+    if hashtag_density is None:
+        hashtag_density = DEFAULT_HASHTAG_DENSITY
+    if url_repeat is None:
+        url_repeat = DEFAULT_URL_REPEAT
+    
+    assert cells_per_msg > 0
+    
+    rnd = random.Random(seed)
+    seen_url_list = []
+    msg_list = []
+    
+    for msg_i in range(count):
+        cell_list = [
+                [create_word(rnd, hashtag_density) for word_i in range(words_per_cell)]
+                for cell_i in range(cells_per_msg)
+                ]
+        
+        for url_i in range(urls_per_msg):
+            if seen_url_list and rnd.random() < url_repeat:
+                url = rnd.choice(seen_url_list)
+            else:
+                url = create_url(rnd)
+                
+                if len(seen_url_list) < 10000:
+                    seen_url_list.append(url)
+            
+            cell = rnd.choice(cell_list)
+            cell.insert(rnd.randint(0, len(cell)), url)
+        
+        msg_list.append('|'.join(' '.join(cell) for cell in cell_list))
+    
+    return msg_list
+
+def count_urls(msg_list):
+    return sum(
+            1
+            for msg in msg_list
+            for word in msg.replace('|', ' ').split(' ')
+            if word.startswith('https://') or word.startswith('http://')
+            )
+
+def add_corpus_arguments(parser):
+    parser.add_argument(
+            '--messages',
+            type=int,
+            default=DEFAULT_MESSAGES,
+            help='count of messages. default is {}'.format(DEFAULT_MESSAGES),
+            )
+    parser.add_argument(
+            '--urls-per-msg',
+            type=int,
+            default=DEFAULT_URLS_PER_MSG,
+            help='urls in each message. default is {}'.format(DEFAULT_URLS_PER_MSG),
+            )
+    parser.add_argument(
+            '--cells-per-msg',
+            type=int,
+            default=DEFAULT_CELLS_PER_MSG,
+            help='``|`` cells in each message. default is {}'.format(
+                    DEFAULT_CELLS_PER_MSG),
+            )
+    parser.add_argument(
+            '--words-per-cell',
+            type=int,
+            default=DEFAULT_WORDS_PER_CELL,
+            help='words in each cell. default is {}'.format(DEFAULT_WORDS_PER_CELL),
+            )
+    parser.add_argument(
+            '--hashtag-density',
+            type=float,
+            default=DEFAULT_HASHTAG_DENSITY,
+            help='part of words, which are hashtag words. default is {}'.format(
+                    DEFAULT_HASHTAG_DENSITY),
+            )
+    parser.add_argument(
+            '--url-repeat',
+            type=float,
+            default=DEFAULT_URL_REPEAT,
+            help='part of urls, which repeat earlier urls. default is {}'.format(
+                    DEFAULT_URL_REPEAT),
+            )
+    parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='seed of random generator. default is 0',
+            )
+
+def get_corpus_kwargs(args):
+    return {
+            'count': args.messages,
+            'urls_per_msg': args.urls_per_msg,
+            'cells_per_msg': args.cells_per_msg,
+            'words_per_cell': args.words_per_cell,
+            'hashtag_density': args.hashtag_density,
+            'url_repeat': args.url_repeat,
+            'seed': args.seed,
+            }
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='synthetic corpus of input news messages',
+            )
+    add_corpus_arguments(parser)
+    parser.add_argument(
+            'out',
+            metavar='OUTPUT-MESSAGES-PATH',
+            help='path to output messages list file',
+            )
+    args = parser.parse_args()
+    
+    msg_list = create_message_list(**get_corpus_kwargs(args))
+    
+    with open(args.out, 'w', encoding='utf-8', newline='\n') as out_fd:
+        for msg in msg_list:
+            out_fd.write('{}\n'.format(msg))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# end-to-end benchmark of ``make_world_news`` engines. each (mode, engine,
+# concurrency) is run in its own process (so peak RSS is its own), short
+# links go to in-process ``fake_server``. results are written as JSON.
+#
+#   $ python3 -m benchmarks.run --engines threads,asyncio --conc 20,200 \
+#           --modes long,short --latency 0.02 --output bench.json
+
+assert str is not bytes
+
+import sys, os, threading, subprocess, argparse, platform, time, json
+from lib_make_world_news_2013_02_12 import hashtag_replacer, fake_server
+from lib_make_world_news_2013_02_12 import make_world_news, async_engine, process_engine
+from . import corpus
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+NEWS_SECRET_KEY = b'benchmark secret key'
+DEFAULT_SITE_URL = 'http://world-news.example.org/'
+MODE_LIST = ('long', 'short')
+ENGINE_MAP = {
+        'threads': make_world_news.make_world_news,
+        'asyncio': async_engine.make_world_news_async,
+        'processes': process_engine.make_world_news_processes,
+        }
+
+def get_percentile(sorted_list, percent):
+    if not sorted_list:
+        return None
+    
+    i = max(int(round(percent / 100.0 * len(sorted_list))) - 1, 0)
+    
+    return sorted_list[min(i, len(sorted_list) - 1)]
+
+def get_peak_rss_kb():
+    if resource is None:
+        return None
+    
+    # for ``processes`` engine, the biggest worker is counted too
+    return max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            )
+
+def run_one(params):
+    msg_list = corpus.create_message_list(**params['corpus'])
+    url_count = corpus.count_urls(msg_list)
+    
+    if params['hashtags']:
+        other_word_func_factory = hashtag_replacer.create_word_func_factory(
+                corpus.HASHTAG_LIST)
+    else:
+        other_word_func_factory = None
+    
+    lock = threading.Lock()
+    begin_map = {}
+    latency_list = []
+    error_list = []
+    done_event = threading.Event()
+    
+    def on_begin(err, data):
+        if err is not None:
+            return
+        
+        with lock:
+            begin_map[data.msg_id] = time.perf_counter()
+    
+    def on_result(err, data):
+        now = time.perf_counter()
+        
+        with lock:
+            latency_list.append(now - begin_map.pop(data.msg_id))
+            
+            if err is not None:
+                error_list.append(err[0].__name__)
+    
+    def on_done(err):
+        if err is not None:
+            error_list.append(err[0].__name__)
+        
+        done_event.set()
+    
+    start_time = time.perf_counter()
+    
+    ENGINE_MAP[params['engine']](
+            msg_list,
+            params['site_url'],
+            NEWS_SECRET_KEY,
+            use_short=params['mode'] == 'short',
+            other_word_func_factory=other_word_func_factory,
+            conc=params['conc'],
+            on_begin=on_begin,
+            on_result=on_result,
+            callback=on_done,
+            )
+    done_event.wait()
+    
+    seconds = time.perf_counter() - start_time
+    latency_list.sort()
+    
+    return {
+            'mode': params['mode'],
+            'engine': params['engine'],
+            'conc': params['conc'],
+            'messages': len(msg_list),
+            'urls': url_count,
+            'errors': len(error_list),
+            'seconds': seconds,
+            'msgs_per_sec': len(msg_list) / seconds,
+            'urls_per_sec': url_count / seconds,
+            'latency_ms': {
+                    'p50': get_percentile(latency_list, 50) * 1000.0,
+                    'p95': get_percentile(latency_list, 95) * 1000.0,
+                    'p99': get_percentile(latency_list, 99) * 1000.0,
+                    } if latency_list else None,
+            'peak_rss_kb': get_peak_rss_kb(),
+            }
+
+def run_child(params):
+    # runs benchmark in separate process. returns its result
+    
+    proc = subprocess.run(
+            (sys.executable, '-m', 'benchmarks.run', '--child', json.dumps(params)),
+            stdout=subprocess.PIPE,
+            check=True,
+            )
+    
+    return json.loads(proc.stdout.decode())
+
+def split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='end-to-end benchmark of ``make_world_news`` engines',
+            )
+    corpus.add_corpus_arguments(parser)
+    parser.add_argument(
+            '--child',
+            metavar='PARAMS-JSON',
+            help=argparse.SUPPRESS,
+            )
+    parser.add_argument(
+            '--modes',
+            default='long',
+            help='comma separated list of {}. default is long'.format(
+                    ', '.join(MODE_LIST)),
+            )
+    parser.add_argument(
+            '--engines',
+            default='threads',
+            help='comma separated list of {}. default is threads'.format(
+                    ', '.join(sorted(ENGINE_MAP))),
+            )
+    parser.add_argument(
+            '--conc',
+            default='',
+            help='comma separated list of concurrency settings. '
+                    'default is default of each engine',
+            )
+    parser.add_argument(
+            '--no-hashtags',
+            action='store_true',
+            help='do not replace hashtags',
+            )
+    parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='delay of each fake server response (seconds). default is 0',
+            )
+    parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.0,
+            help='max random addition to delay (seconds). default is 0',
+            )
+    parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='part of fake server responses with status 500. default is 0',
+            )
+    parser.add_argument(
+            '--label',
+            help='label of this run (for example, release version)',
+            )
+    parser.add_argument(
+            '--output',
+            metavar='RESULT-JSON-PATH',
+            help='path to result JSON file. default is stdout',
+            )
+    args = parser.parse_args()
+    
+    if args.child is not None:
+        print(json.dumps(run_one(json.loads(args.child))))
+        return
+    
+    mode_list = split_list(args.modes)
+    engine_list = split_list(args.engines)
+    conc_list = [int(conc) for conc in split_list(args.conc)] or [None]
+    
+    for mode in mode_list:
+        if mode not in MODE_LIST:
+            parser.error('unknown mode: {!r}'.format(mode))
+    for engine in engine_list:
+        if engine not in ENGINE_MAP:
+            parser.error('unknown engine: {!r}'.format(engine))
+    
+    if 'short' in mode_list:
+        fake = fake_server.FakeWorldNewsServer(
+                latency=args.latency,
+                jitter=args.jitter,
+                error_rate=args.error_rate,
+                seed=args.seed,
+                )
+        fake.start()
+        site_url = fake.site_url
+    else:
+        fake = None
+        site_url = DEFAULT_SITE_URL
+    
+    result_list = []
+    
+    try:
+        for mode in mode_list:
+            for engine in engine_list:
+                if mode == 'short' and engine == 'processes':
+                    continue
+                
+                for conc in conc_list:
+                    result = run_child({
+                            'corpus': corpus.get_corpus_kwargs(args),
+                            'hashtags': not args.no_hashtags,
+                            'site_url': site_url,
+                            'mode': mode,
+                            'engine': engine,
+                            'conc': conc,
+                            })
+                    result_list.append(result)
+                    
+                    print(
+                            '{mode:<6} {engine:<10} conc={conc!s:<5} '
+                            '{msgs_per_sec:10.1f} msg/s {urls_per_sec:10.1f} url/s '
+                            'errors={errors}'.format(**result),
+                            file=sys.stderr,
+                            )
+    finally:
+        if fake is not None:
+            fake.close()
+    
+    report = {
+            'label': args.label,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'corpus': corpus.get_corpus_kwargs(args),
+            'hashtags': not args.no_hashtags,
+            'server': {
+                    'latency': args.latency,
+                    'jitter': args.jitter,
+                    'error_rate': args.error_rate,
+                    },
+            'results': result_list,
+            }
+    report_json = json.dumps(report, indent=4, sort_keys=True)
+    
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8', newline='\n') as out_fd:
+            out_fd.write('{}\n'.format(report_json))
+    else:
+        print(report_json)
+
+if __name__ == '__main__':
+    main()
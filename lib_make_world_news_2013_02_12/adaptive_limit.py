@@ -0,0 +1,196 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, asyncio, time
+from . import http_pool, shortener
+
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_FACTOR = 4 # max limit is ``DEFAULT_MAX_FACTOR * initial``
+DEFAULT_LATENCY_TARGET = 2.0 # seconds
+DECREASE_FACTOR = 0.5
+
+def is_healthy_status(status):
+    # ``NO_BATCH_STATUSES`` is just answer to probe of ``api/sh/new_batch``
+    
+    return status == 200 or status in shortener.NO_BATCH_STATUSES
+
+class AimdLimiter:
+    # adaptive limit of requests in flight (additive increase, multiplicative
+    # decrease). while requests are ok and faster than ``latency_target``,
+    # the limit grows by one per round trip (if it is really used). timeout,
+    # error or unhealthy status cuts it by half -- once per round trip, so
+    # one burst of failures is one cut.
+    #
+    # ``release()`` with ``ok=None`` gives no verdict: the request was
+    # aborted by cancel of run, which says nothing about server.
+    #
+    # ``acquire()``/``release()`` are for threads,
+    # ``async_acquire()``/``async_release()`` are for one event loop
+    
+    def __init__(self, initial, min_limit=None, max_limit=None, latency_target=None):
+        if min_limit is None:
+            min_limit = DEFAULT_MIN_LIMIT
+        if max_limit is None:
+            max_limit = max(initial * DEFAULT_MAX_FACTOR, initial)
+        if latency_target is None:
+            latency_target = DEFAULT_LATENCY_TARGET
+        
+        assert 0 < min_limit <= initial <= max_limit
+        
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._latency_target = latency_target
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._aio_cond = None
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._seq = 0
+        self._cut_seq = 0
+        self.lowest_limit = initial
+        self.highest_limit = initial
+        self.cut_count = 0
+    
+    @property
+    def limit(self):
+        return int(self._limit)
+    
+    def _try_begin(self):
+        # returns token or ``None``, if limit is reached
+        
+        if self._in_flight >= int(self._limit):
+            return None
+        
+        self._in_flight += 1
+        self._seq += 1
+        
+        return self._seq, time.monotonic()
+    
+    def _end(self, token, ok):
+        seq, start_time = token
+        limited = self._in_flight >= int(self._limit)
+        self._in_flight -= 1
+        
+        if ok is None:
+            pass
+        elif ok:
+            if limited and time.monotonic() - start_time <= self._latency_target:
+                self._limit = min(self._limit + 1.0 / self._limit, float(self.max_limit))
+                self.highest_limit = max(self.highest_limit, self.limit)
+        elif seq > self._cut_seq:
+            # requests, which were sent before this cut, are not counted again
+            self._limit = max(self._limit * DECREASE_FACTOR, float(self.min_limit))
+            self._cut_seq = self._seq
+            self.lowest_limit = min(self.lowest_limit, self.limit)
+            self.cut_count += 1
+        
+        return max(int(self._limit) - self._in_flight, 0)
+    
+    # threadsafe function
+    def acquire(self):
+        with self._cond:
+            while True:
+                token = self._try_begin()
+                
+                if token is not None:
+                    return token
+                
+                self._cond.wait()
+    
+    # threadsafe function
+    def release(self, token, ok):
+        with self._cond:
+            self._cond.notify(self._end(token, ok))
+    
+    async def async_acquire(self):
+        if self._aio_cond is None:
+            self._aio_cond = asyncio.Condition()
+        
+        async with self._aio_cond:
+            while True:
+                with self._lock:
+                    token = self._try_begin()
+                
+                if token is not None:
+                    return token
+                
+                await self._aio_cond.wait()
+    
+    async def async_release(self, token, ok):
+        with self._lock:
+            free_count = self._end(token, ok)
+        
+        async with self._aio_cond:
+            self._aio_cond.notify(free_count)
+
+class LimitedPool:
+    # wraps ``http_pool.HttpPool``. each request is counted by ``limiter``
+    
+    def __init__(self, pool, limiter):
+        self._pool = pool
+        self._limiter = limiter
+    
+    # threadsafe function
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        token = self._limiter.acquire()
+        ok = False
+        
+        try:
+            status, data = self._pool.request(
+                    method, url, body=body, headers=headers, timeout=timeout)
+            ok = is_healthy_status(status)
+            
+            return status, data
+        except http_pool.Aborted:
+            ok = None
+            
+            raise
+        finally:
+            self._limiter.release(token, ok)
+    
+    def close(self):
+        self._pool.close()
+
+class AsyncLimitedPool:
+    # wraps ``aio_http.AioHttpPool``. each request is counted by ``limiter``
+    
+    def __init__(self, pool, limiter):
+        self._pool = pool
+        self._limiter = limiter
+    
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        token = await self._limiter.async_acquire()
+        ok = False
+        
+        try:
+            status, data = await self._pool.request(
+                    method, url, body=body, headers=headers, timeout=timeout)
+            ok = is_healthy_status(status)
+            
+            return status, data
+        except asyncio.CancelledError:
+            # task is cancelled by cancel of run
+            ok = None
+            
+            raise
+        finally:
+            await self._limiter.async_release(token, ok)
+    
+    async def close(self):
+        await self._pool.close()
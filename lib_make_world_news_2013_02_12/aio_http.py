@@ -0,0 +1,216 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# minimal asyncio HTTP/1.1 client (only what is need for shortener calls)
+
+assert str is not bytes
+
+import asyncio, time
+from urllib import parse as url_parse
+from . import http_pool
+
+DEAD_CONN_ERRORS = (
+        asyncio.IncompleteReadError,
+        ConnectionResetError,
+        ConnectionAbortedError,
+        BrokenPipeError,
+        )
+
+class HttpError(IOError):
+    pass
+
+class _Conn:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+    
+    def close(self):
+        self.writer.close()
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunk_list = []
+        
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            
+            if not size:
+                # skipping trailer
+                while await reader.readuntil(b'\r\n') != b'\r\n':
+                    pass
+                
+                return b''.join(chunk_list), True
+            
+            chunk_list.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    
+    content_length = headers.get('content-length')
+    
+    if content_length is not None:
+        content_length = int(content_length)
+        
+        if content_length > http_pool.MAX_RESP_SIZE:
+            raise HttpError('response is too large')
+        
+        return await reader.readexactly(content_length), True
+    
+    # body till end of connection. ``reader.read(n)`` returns as soon as some
+    # bytes are there, so it is read by parts (up to ``MAX_RESP_SIZE``, as
+    # ``http.client`` in ``http_pool`` does)
+    part_list = []
+    left_size = http_pool.MAX_RESP_SIZE
+    
+    while left_size > 0:
+        part = await reader.read(left_size)
+        
+        if not part:
+            break
+        
+        part_list.append(part)
+        left_size -= len(part)
+    
+    return b''.join(part_list), False
+
+class AioHttpPool:
+    # asyncio variant of ``http_pool.HttpPool``. must be used inside one
+    # event loop
+    
+    def __init__(self, size=None, idle_timeout=None):
+        if size is None:
+            size = http_pool.DEFAULT_POOL_SIZE
+        if idle_timeout is None:
+            idle_timeout = http_pool.DEFAULT_IDLE_TIMEOUT
+        
+        self._size = size
+        self._idle_timeout = idle_timeout
+        self._idle_map = {}
+    
+    async def _get_conn(self, host_key, timeout):
+        now = time.monotonic()
+        idle_list = self._idle_map.get(host_key)
+        
+        while idle_list:
+            conn = idle_list.pop()
+            
+            if now - conn.last_used < self._idle_timeout and \
+                    not conn.reader.at_eof():
+                return conn, True
+            
+            conn.close()
+        
+        scheme, host, port = host_key
+        # not reachable host must not wait for connect timeout of OS
+        reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                        host, port, ssl=True if scheme == 'https' else None),
+                timeout,
+                )
+        
+        return _Conn(reader, writer), False
+    
+    def _put_conn(self, host_key, conn):
+        idle_list = self._idle_map.setdefault(host_key, [])
+        
+        if len(idle_list) >= self._size:
+            conn.close()
+            return
+        
+        conn.last_used = time.monotonic()
+        idle_list.append(conn)
+    
+    async def _request(self, conn, method, host_key, netloc, selector, body, headers):
+        head_list = [
+                '{} {} HTTP/1.1'.format(method, selector),
+                'Host: {}'.format(netloc),
+                'Content-Length: {}'.format(len(body) if body else 0),
+                ]
+        head_list.extend('{}: {}'.format(k, v) for k, v in headers.items())
+        
+        conn.writer.write('\r\n'.join(head_list).encode('latin-1') + b'\r\n\r\n')
+        
+        if body:
+            conn.writer.write(body)
+        
+        await conn.writer.drain()
+        
+        status_line = await conn.reader.readuntil(b'\r\n')
+        status = int(status_line.split(None, 2)[1])
+        resp_headers = {}
+        
+        while True:
+            line = await conn.reader.readuntil(b'\r\n')
+            
+            if line == b'\r\n':
+                break
+            
+            k, v = line.decode('latin-1').split(':', 1)
+            resp_headers[k.strip().lower()] = v.strip()
+        
+        data, keep_alive = await _read_body(conn.reader, resp_headers)
+        
+        if keep_alive and resp_headers.get('connection', '').lower() != 'close':
+            self._put_conn(host_key, conn)
+        else:
+            conn.close()
+        
+        return status, data
+    
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        if headers is None:
+            headers = {}
+        if timeout is None:
+            timeout = http_pool.DEFAULT_TIMEOUT
+        
+        split_url = url_parse.urlsplit(url)
+        scheme = split_url.scheme
+        port = split_url.port or (443 if scheme == 'https' else 80)
+        host_key = scheme, split_url.hostname, port
+        selector = split_url.path or '/'
+        
+        if split_url.query:
+            selector = '{}?{}'.format(selector, split_url.query)
+        
+        while True:
+            conn, reused = await self._get_conn(host_key, timeout)
+            
+            try:
+                return await asyncio.wait_for(
+                        self._request(conn, method, host_key, split_url.netloc,
+                                selector, body, headers),
+                        timeout,
+                        )
+            except DEAD_CONN_ERRORS:
+                conn.close()
+                
+                if reused:
+                    # reconnecting transparently
+                    continue
+                
+                raise
+            except:
+                conn.close()
+                
+                raise
+    
+    async def close(self):
+        for idle_list in self._idle_map.values():
+            for conn in idle_list:
+                conn.close()
+        
+        self._idle_map.clear()
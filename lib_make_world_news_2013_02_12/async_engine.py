@@ -0,0 +1,192 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import sys, threading, time, asyncio
+from concurrent import futures
+from . import aio_http, shortener, url_memo, message_transformer, adaptive_limit, cancel
+from . import rate_limit
+from .make_world_news import Data
+
+DEFAULT_CONCURRENCY = shortener.DEFAULT_ASYNC_CONCURRENCY
+
+async def process_message(data, transformer, on_result):
+    try:
+        data.result = await transformer.async_transform(data.in_msg)
+    except asyncio.CancelledError:
+        # task is cancelled only by ``cancel_token``
+        
+        if on_result is not None:
+            try:
+                raise cancel.Cancelled('transform is cancelled')
+            except cancel.Cancelled:
+                on_result(sys.exc_info(), data)
+    except Exception:
+        if on_result is not None:
+            on_result(sys.exc_info(), data)
+    else:
+        if on_result is not None:
+            on_result(None, data)
+
+async def make_world_news_coro(in_msg_list,
+        site_url, news_secret_key, use_short=None, other_word_func_factory=None,
+        short_func=None, memo=None, conc=None, limiter=None, bucket=None,
+        stats=None, cancel_token=None, on_begin=None, on_result=None):
+    if use_short is None:
+        use_short = False
+    if conc is None:
+        conc = DEFAULT_CONCURRENCY
+    if memo is None:
+        memo = url_memo.UrlMemo()
+    if limiter is not None:
+        conc = limiter.max_limit
+    
+    if use_short and short_func is None:
+        short_pool = aio_http.AioHttpPool(size=conc)
+        
+        if bucket is not None:
+            short_pool = rate_limit.AsyncRateLimitedPool(short_pool, bucket, stats=stats)
+        
+        if limiter is not None:
+            short_pool = adaptive_limit.AsyncLimitedPool(short_pool, limiter)
+        
+        short_func = shortener.AsyncShortener(site_url, pool=short_pool, conc=conc)
+    
+    transformer = message_transformer.MessageTransformer(
+            site_url,
+            news_secret_key,
+            use_short=use_short,
+            other_word_func_factory=other_word_func_factory,
+            short_func=short_func,
+            memo=memo,
+            stats=stats,
+            )
+    
+    loop = asyncio.get_running_loop()
+    msg_sem = asyncio.Semaphore(conc)
+    in_msg_iter = enumerate(in_msg_list)
+    task_set = set()
+    
+    # ``in_msg_list`` may block (for example, when it is throttled by
+    # ``reorder_buffer``). so it is read outside of event loop
+    reader = futures.ThreadPoolExecutor(max_workers=1)
+    
+    def on_task_done(task):
+        task_set.discard(task)
+        msg_sem.release()
+    
+    def on_cancel():
+        for task in tuple(task_set):
+            task.cancel()
+    
+    def on_cancel_threadsafe():
+        loop.call_soon_threadsafe(on_cancel)
+    
+    if cancel_token is not None:
+        cancel_token.add_callback(on_cancel_threadsafe)
+    
+    try:
+        while True:
+            await msg_sem.acquire()
+            
+            if cancel_token is not None and cancel_token.cancelled:
+                msg_sem.release()
+                
+                break
+            
+            data = Data()
+            
+            start_time = time.perf_counter()
+            
+            try:
+                item = await loop.run_in_executor(reader, next, in_msg_iter, None)
+            except Exception:
+                msg_sem.release()
+                
+                if on_begin is not None:
+                    on_begin(sys.exc_info(), data)
+                
+                continue
+            
+            if stats is not None:
+                stats.add_time('read', time.perf_counter() - start_time)
+            
+            if item is None or \
+                    cancel_token is not None and cancel_token.cancelled:
+                msg_sem.release()
+                
+                break
+            
+            data.msg_id, data.in_msg = item
+            
+            if on_begin is not None:
+                on_begin(None, data)
+            
+            task = loop.create_task(process_message(data, transformer, on_result))
+            task_set.add(task)
+            task.add_done_callback(on_task_done)
+        
+        if task_set:
+            await asyncio.wait(tuple(task_set))
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(on_cancel_threadsafe)
+        
+        reader.shutdown(wait=False)
+        
+        # connections of ``short_func`` belong to event loop of this run
+        short_func_close = getattr(short_func, 'close', None)
+        
+        if short_func_close is not None:
+            await short_func_close()
+
+def make_world_news_async(in_msg_list,
+        site_url, news_secret_key, use_short=None, other_word_func_factory=None,
+        short_func=None, memo=None, conc=None, limiter=None, bucket=None,
+        stats=None, cancel_token=None, on_begin=None, on_result=None, callback=None):
+    # the same contract as ``make_world_news.make_world_news()``, but messages
+    # are processed by one asyncio event loop (in its own thread), and up to
+    # ``conc`` messages are in flight. ``short_func`` (if given) must be
+    # asyncio variant, like ``shortener.AsyncShortener``
+    
+    def in_thread():
+        try:
+            asyncio.run(make_world_news_coro(
+                    in_msg_list,
+                    site_url,
+                    news_secret_key,
+                    use_short=use_short,
+                    other_word_func_factory=other_word_func_factory,
+                    short_func=short_func,
+                    memo=memo,
+                    conc=conc,
+                    limiter=limiter,
+                    bucket=bucket,
+                    stats=stats,
+                    cancel_token=cancel_token,
+                    on_begin=on_begin,
+                    on_result=on_result,
+                    ))
+        except Exception:
+            if callback is not None:
+                callback(sys.exc_info())
+        else:
+            if callback is not None:
+                callback(None)
+    
+    threading.Thread(target=in_thread).start()
@@ -0,0 +1,75 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+assert str is not bytes
+
+import threading
+
+class Cancelled(Exception):
+    pass
+
+class CancelToken:
+    # is shared by engine and its owner. ``cancel()`` may be called from any
+    # thread. engines check ``cancelled`` between messages and urls, and
+    # callbacks (of ``add_callback()``) abort what is in flight, for example
+    # ``http_pool.HttpPool.abort()``
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callback_list = []
+    
+    @property
+    def cancelled(self):
+        return self._cancelled
+    
+    # threadsafe function
+    def check(self):
+        if self._cancelled:
+            raise Cancelled('transform is cancelled')
+    
+    # threadsafe function
+    def add_callback(self, callback):
+        # if token is already cancelled, ``callback`` is called at once
+        
+        with self._lock:
+            if not self._cancelled:
+                self._callback_list.append(callback)
+                
+                return
+        
+        callback()
+    
+    # threadsafe function
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callback_list:
+                self._callback_list.remove(callback)
+    
+    # threadsafe function
+    def cancel(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            
+            self._cancelled = True
+            callback_list = self._callback_list
+            self._callback_list = []
+        
+        for callback in callback_list:
+            callback()
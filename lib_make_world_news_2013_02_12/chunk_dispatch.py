@@ -0,0 +1,110 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+assert str is not bytes
+
+import sys, threading, time
+
+DEFAULT_MAX_CHUNK_SIZE = 64
+DEFAULT_TARGET_SECONDS = 0.002
+COST_WEIGHT = 0.2 # weight of last chunk in moving average of message cost
+
+# hands ``(msg_id, in_msg)`` of one input iterator to worker threads by
+# chunks, so lock of iterator is taken once per chunk, not per message.
+#
+# chunk size follows moving average of cost of message, measured by
+# workers as thread time (``time.thread_time()``: wall time would grow with
+# count of threads, which wait for GIL): one chunk costs about
+# ``target_seconds``. cheap messages go in big chunks, expensive ones go
+# one by one and stay spread over all workers. first chunk has one message.
+#
+# thread time does not see waiting for network, so with short links, where
+# it is most of time of message, ``max_chunk_size`` must be 1
+#
+# ``max_chunk_size`` must not be greater than window of
+# ``reorder_buffer.ReorderBuffer.throttle()``: else a worker could wait for
+# window, holding the oldest message itself
+class ChunkDispatcher:
+    def __init__(self, in_msg_iter, max_chunk_size=None, target_seconds=None,
+            stats=None):
+        if max_chunk_size is None:
+            max_chunk_size = DEFAULT_MAX_CHUNK_SIZE
+        if target_seconds is None:
+            target_seconds = DEFAULT_TARGET_SECONDS
+        
+        assert max_chunk_size > 0
+        assert target_seconds > 0.0
+        
+        self.max_chunk_size = max_chunk_size
+        self.target_seconds = target_seconds
+        self.stats = stats
+        
+        self._in_msg_iter = in_msg_iter
+        self._lock = threading.Lock()
+        self._end = False
+        self._msg_cost = None
+        self._chunk_size = 1
+    
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+    
+    def _update_chunk_size(self, done_count, done_seconds):
+        msg_cost = done_seconds / done_count
+        
+        if self._msg_cost is None:
+            self._msg_cost = msg_cost
+        else:
+            self._msg_cost += COST_WEIGHT * (msg_cost - self._msg_cost)
+        
+        if self._msg_cost * self.max_chunk_size <= self.target_seconds:
+            self._chunk_size = self.max_chunk_size
+        else:
+            self._chunk_size = max(int(self.target_seconds / self._msg_cost), 1)
+    
+    # threadsafe function
+    def take(self, done_count=None, done_seconds=None):
+        # ``done_count`` messages of previous chunk of caller took
+        # ``done_seconds`` of thread time. returns ``(chunk, err)``: list of
+        # ``(msg_id, in_msg)`` and ``sys.exc_info()`` of failed reading after
+        # them (or ``None``). empty chunk without ``err`` -- input is over
+        
+        chunk = []
+        err = None
+        
+        with self._lock:
+            if done_count:
+                self._update_chunk_size(done_count, done_seconds)
+            
+            start_time = time.perf_counter()
+            
+            try:
+                while not self._end and len(chunk) < self._chunk_size:
+                    try:
+                        chunk.append(next(self._in_msg_iter))
+                    except StopIteration:
+                        self._end = True
+                    except Exception:
+                        err = sys.exc_info()
+                        
+                        break
+            finally:
+                if self.stats is not None:
+                    self.stats.add_time('read', time.perf_counter() - start_time)
+        
+        return chunk, err
@@ -0,0 +1,225 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# local stand-in for ``api/sh/new`` (and ``api/sh/new_batch``) of web-site of
+# class ``world-news``. for testing short links offline
+
+assert str is not bytes
+
+import threading, argparse, random, time, base64, json
+from http import server as http_server
+from urllib import parse as url_parse
+
+DEFAULT_HOST = '127.0.0.1'
+REQUEST_QUEUE_SIZE = 1024
+
+def get_micro_news_url(site_url, news_key_b64):
+    news_key = base64.b64decode(news_key_b64.encode())
+    micro_key = base64.urlsafe_b64encode(news_key).decode().rstrip('=')
+    
+    return url_parse.urljoin(site_url, 'sh/{}'.format(micro_key))
+
+class FakeRequestHandler(http_server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode()
+        
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _short(self, sh_item):
+        original_news_url = sh_item['original_news_url']
+        news_key_b64 = sh_item['news_key']
+        
+        assert isinstance(original_news_url, str)
+        
+        return {
+                'micro_news_url': get_micro_news_url(
+                        self.server.fake.site_url, news_key_b64),
+                }
+    
+    def do_POST(self):
+        fake = self.server.fake
+        content_length = int(self.headers.get('Content-Length', 0))
+        sh_data = json.loads(self.rfile.read(content_length).decode('utf-8', 'replace'))
+        path = url_parse.urlsplit(self.path).path
+        
+        delay, fail = fake.next_response()
+        
+        if delay:
+            time.sleep(delay)
+        
+        if fail:
+            self._send_json(500, {'error': 'fake error'})
+            return
+        
+        if path == '/api/sh/new':
+            fake.count_request(1)
+            self._send_json(200, self._short(sh_data))
+            return
+        
+        if path == '/api/sh/new_batch' and fake.batch:
+            sh_item_list = sh_data['items']
+            fake.count_request(len(sh_item_list))
+            self._send_json(200, {
+                    'items': [self._short(sh_item) for sh_item in sh_item_list],
+                    })
+            return
+        
+        self._send_json(404, {'error': 'not found'})
+
+class FakeHttpServer(http_server.ThreadingHTTPServer):
+    # many workers connect at once. default listen backlog is too small
+    request_queue_size = REQUEST_QUEUE_SIZE
+    daemon_threads = True
+
+class FakeWorldNewsServer:
+    # ``latency`` and ``jitter`` are in seconds. each response is delayed by
+    # ``latency`` plus random ``[0, jitter)``. ``error_rate`` is part of
+    # responses (``0.0 .. 1.0``) with status 500
+    
+    def __init__(self, host=None, port=None, batch=None,
+            latency=None, jitter=None, error_rate=None, seed=None):
+        if host is None:
+            host = DEFAULT_HOST
+        if port is None:
+            port = 0
+        if batch is None:
+            batch = True
+        if latency is None:
+            latency = 0.0
+        if jitter is None:
+            jitter = 0.0
+        if error_rate is None:
+            error_rate = 0.0
+        
+        self.batch = batch
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.request_count = 0
+        self.item_count = 0
+        self._lock = threading.Lock()
+        self._httpd = FakeHttpServer((host, port), FakeRequestHandler)
+        self._httpd.fake = self
+        self._thread = None
+        
+        host, port = self._httpd.server_address[:2]
+        self.site_url = 'http://{}:{}/'.format(host, port)
+    
+    # threadsafe function
+    def next_response(self):
+        # returns ``(delay, fail)``
+        
+        with self._lock:
+            delay = self.latency
+            
+            if self.jitter:
+                delay += self._random.random() * self.jitter
+            
+            fail = self.error_rate and self._random.random() < self.error_rate
+        
+        return delay, fail
+    
+    # threadsafe function
+    def count_request(self, item_count):
+        with self._lock:
+            self.request_count += 1
+            self.item_count += item_count
+    
+    def serve_forever(self):
+        self._httpd.serve_forever()
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def close(self):
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        
+        self._httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='local stand-in server for short links of '
+                    'web-sites of class ``world-news``.',
+            )
+    parser.add_argument(
+            '--host',
+            help='host to listen. default is {}'.format(DEFAULT_HOST),
+            )
+    parser.add_argument(
+            '--port',
+            type=int,
+            default=8080,
+            help='port to listen. default is 8080',
+            )
+    parser.add_argument(
+            '--no-batch',
+            action='store_true',
+            help='do not support ``api/sh/new_batch``',
+            )
+    parser.add_argument(
+            '--latency',
+            type=float,
+            help='delay of each response (seconds)',
+            )
+    parser.add_argument(
+            '--jitter',
+            type=float,
+            help='max random addition to delay of each response (seconds)',
+            )
+    parser.add_argument(
+            '--error-rate',
+            type=float,
+            help='part of responses (0.0 .. 1.0) with status 500',
+            )
+    args = parser.parse_args()
+    
+    fake = FakeWorldNewsServer(
+            host=args.host,
+            port=args.port,
+            batch=not args.no_batch,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            )
+    
+    print('listening: {}'.format(fake.site_url))
+    
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.close()
+
+if __name__ == '__main__':
+    main()
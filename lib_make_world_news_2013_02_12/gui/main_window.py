@@ -18,14 +18,93 @@
 
 assert str is not bytes
 
-import threading, base64, heapq
+import threading, base64, time, collections, tempfile, shutil
 import tkinter
 from tkinter import ttk, scrolledtext, filedialog
 from . import tk_mt, tk_async
-from .. import fix_url, read_list, hashtag_replacer, make_world_news
+from .. import fix_url, read_list, hashtag_replacer, make_world_news, reorder_buffer
+from .. import cancel
 
 DEFAULT_MAIN_WINDOW_WIDTH = 700
 DEFAULT_MAIN_WINDOW_HEIGHT = 500
+RENDER_DELAY = 100 # milliseconds
+PREVIEW_SIZE = 1000 # lines of result, shown for file
+
+class TransformRun:
+    # state of one transform, shared with worker threads. results go in
+    # ``msg_id`` order (failed messages are skipped), as soon as each
+    # contiguous prefix is ready, to temporary ``result_fd`` and to
+    # ``line_deque``, but only first ``preview_size`` of them. UI takes
+    # them from ``line_deque``.
+    #
+    # ``msg_count`` may be ``None``, while input is not counted. run is
+    # stopped by ``cancel_token``
+    
+    def __init__(self, msg_count=None, preview_size=None):
+        self.msg_count = msg_count
+        self.preview_size = preview_size
+        self.start_time = time.monotonic()
+        self.cancel_token = cancel.CancelToken()
+        self.result_fd = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self.line_deque = collections.deque()
+        self.reorder = reorder_buffer.ReorderBuffer(self._write_result)
+        self.done_count = 0
+        self.error_count = 0
+        self.preview_count = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def preview_full(self):
+        return self.reorder.written > self.preview_count
+    
+    def _write_result(self, result):
+        # it is called under lock of ``reorder``
+        
+        self.result_fd.write('{}\n'.format(result))
+        
+        if self.preview_size is None or self.preview_count < self.preview_size:
+            self.line_deque.append(result)
+            self.preview_count += 1
+    
+    # threadsafe function
+    def put_read_error(self, err, data):
+        if err is None:
+            return
+        
+        with self._lock:
+            self.error_count += 1
+    
+    # threadsafe function
+    def put_result(self, err, data):
+        with self._lock:
+            self.done_count += 1
+            
+            if err is not None:
+                self.error_count += 1
+        
+        self.reorder.put(data.msg_id, data.result if err is None else None)
+    
+    def get_rate(self):
+        elapsed = time.monotonic() - self.start_time
+        
+        if elapsed <= 0.0:
+            return 0.0
+        
+        return self.done_count / elapsed
+    
+    def save(self, path):
+        # result is already on disk. it is just copied
+        
+        self.result_fd.flush()
+        self.result_fd.seek(0)
+        
+        with open(path, 'w', encoding='utf-8') as fd:
+            shutil.copyfileobj(self.result_fd, fd)
+        
+        self.result_fd.seek(0, 2)
+    
+    def close(self):
+        self.result_fd.close()
 
 class MainWindow:
     def __init__(self):
@@ -41,12 +120,16 @@ class MainWindow:
         self._program_menu = tkinter.Menu(master=self._menubar)
         self._program_menu.add_command(label='New Data', command=self._new_data_cmd)
         self._program_menu.add_command(label='Transform', command=self._transform_cmd)
+        self._program_menu.add_command(label='Transform File\u2026',
+                command=self._transform_file_cmd)
         self._program_menu.add_command(label='Load Hashtag Word List from File',
                 command=self._load_hashtag_list_cmd)
         self._program_menu.add_command(label='Paste Input Messages',
                 command=self._paste_in_msgs_cmd)
         self._program_menu.add_command(label='Copy Result',
                 command=self._copy_result_cmd)
+        self._program_menu.add_command(label='Save Result As\u2026',
+                command=self._save_result_cmd)
         self._program_menu.add_separator()
         self._program_menu.add_command(label='Close', command=self._close_cmd)
         self._menubar.add_cascade(label='Program', menu=self._program_menu)
@@ -89,6 +172,10 @@ class MainWindow:
         self._transform_button = ttk.Button(master=self._bottom_frame,
                 text='Transform',
                 command=self._transform_cmd)
+        self._cancel_button = ttk.Button(master=self._bottom_frame,
+                text='Cancel',
+                command=self._cancel_cmd)
+        self._cancel_button.config(state=tkinter.DISABLED)
         
         self._paste_in_msgs_button = ttk.Button(master=self._bottom_frame,
                 text='Paste Input Messages',
@@ -104,6 +191,8 @@ class MainWindow:
         self._status_var = tkinter.StringVar()
         self._statusbar = ttk.Label(master=self._bottom_frame,
                 textvariable=self._status_var)
+        self._progressbar = ttk.Progressbar(master=self._bottom_frame,
+                mode='determinate')
         
         self._site_url_label.pack(side=tkinter.LEFT,padx=10, pady=10)
         self._site_url_entry.pack(fill=tkinter.X, padx=10, pady=10)
@@ -121,7 +210,9 @@ class MainWindow:
         
         self._new_data_button.pack(side=tkinter.LEFT, padx=10, pady=10)
         self._transform_button.pack(side=tkinter.LEFT, padx=10, pady=10)
+        self._cancel_button.pack(side=tkinter.LEFT, padx=10, pady=10)
         self._statusbar.pack(side=tkinter.LEFT, expand=True, padx=10, pady=10)
+        self._progressbar.pack(side=tkinter.LEFT, padx=10, pady=10)
         
         self._close_button.pack(side=tkinter.RIGHT, padx=10, pady=10)
         self._copy_result_button.pack(side=tkinter.RIGHT, padx=10, pady=10)
@@ -132,6 +223,7 @@ class MainWindow:
         self._bottom_frame.pack(side=tkinter.BOTTOM, fill=tkinter.X)
         
         self._result_state = False
+        self._result_run = None
         self._busy_state = False
         self._busy_state_id = object()
         self._set_status('Ready')
@@ -153,6 +245,11 @@ class MainWindow:
         
         self._result_state = False
         self._set_status('Ready')
+        self._progressbar.config(value=0)
+        
+        if self._result_run is not None:
+            self._result_run.close()
+            self._result_run = None
         
         self._new_data_button.config(state=tkinter.DISABLED)
         self._copy_result_button.config(state=tkinter.DISABLED)
@@ -166,16 +263,14 @@ class MainWindow:
         
         self._text.delete('1.0', tkinter.END)
     
-    def _transform_cmd(self):
-        if self._busy_state or self._result_state:
-            self._root.bell()
-            return
+    def _get_transform_params(self):
+        # returns ``(site_url, news_secret_key, use_short,
+        # other_word_func_factory)``, or ``None`` if they are wrong
         
         site_url = self._site_url_entry.get().strip()
         news_secret_key_b64 = self._news_secret_key_entry.get().strip()
         use_short = self._use_short_var.get()
         hashtag_list_str = self._hashtag_list_entry.get().strip()
-        in_msg_text = self._text.get('1.0', tkinter.END).strip()
         
         site_url = fix_url.fix_url(site_url)
         
@@ -184,6 +279,9 @@ class MainWindow:
         except ValueError:
             news_secret_key = None
         
+        if not site_url or not news_secret_key:
+            return None
+        
         if hashtag_list_str:
             other_word_func_factory = hashtag_replacer.create_word_func_factory(
                     hashtag_list_str.split(),
@@ -191,6 +289,16 @@ class MainWindow:
         else:
             other_word_func_factory = None
         
+        return site_url, news_secret_key, use_short, other_word_func_factory
+    
+    def _transform_cmd(self):
+        if self._busy_state or self._result_state:
+            self._root.bell()
+            return
+        
+        params = self._get_transform_params()
+        in_msg_text = self._text.get('1.0', tkinter.END).strip()
+        
         in_msg_list = tuple(filter(
                 None,
                 map(
@@ -199,11 +307,78 @@ class MainWindow:
                         ),
                 ))
         
-        if not in_msg_list or not site_url or not news_secret_key:
+        if not in_msg_list or params is None:
             self._root.bell()
             return
         
+        self._start_transform(params, in_msg_list, TransformRun(len(in_msg_list)))
+    
+    def _transform_file_result(self, err, busy_state_id, result):
+        if self._busy_state or busy_state_id != self._busy_state_id or self._result_state:
+            return
+        
+        if err or not result:
+            return
+        
+        in_path = str(result)
+        params = self._get_transform_params()
+        
+        if params is None:
+            self._root.bell()
+            return
+        
+        try:
+            # only to fail here, if file can not be read
+            open(in_path, 'rb').close()
+        except OSError:
+            self._root.bell()
+            return
+        
+        transform_run = TransformRun(preview_size=PREVIEW_SIZE)
+        
+        # messages are read while transform goes, but not more than window
+        # of ``reorder`` ahead of written results
+        self._start_transform(
+                params,
+                transform_run.reorder.throttle(read_list.read_list(in_path)),
+                transform_run,
+                )
+        
+        busy_state_id = self._busy_state_id
+        
+        self._tk_mt.start_daemon(
+                lambda: sum(1 for in_msg in read_list.read_list(in_path)),
+                callback=lambda msg_count, error: self._on_msg_count(
+                        error, busy_state_id, transform_run, msg_count),
+                )
+    
+    def _transform_file_cmd(self):
+        if self._busy_state or self._result_state:
+            self._root.bell()
+            return
+        
+        tk_async.tk_async(
+                self._root,
+                lambda: filedialog.askopenfilename(parent=self._root),
+                self._busy_state_id,
+                callback=self._transform_file_result,
+                )
+    
+    def _on_msg_count(self, err, busy_state_id, transform_run, msg_count):
+        if not self._busy_state or busy_state_id != self._busy_state_id:
+            return
+        
+        if err is not None:
+            return
+        
+        transform_run.msg_count = msg_count
+        self._progressbar.config(mode='determinate', maximum=msg_count)
+    
+    def _start_transform(self, params, in_msg_list, transform_run):
+        site_url, news_secret_key, use_short, other_word_func_factory = params
+        
         self._result_state = True
+        self._result_run = transform_run
         self._busy_state = True
         self._busy_state_id = object()
         self._set_status('Working')
@@ -220,15 +395,18 @@ class MainWindow:
         self._paste_in_msgs_button.config(state=tkinter.DISABLED)
         self._copy_result_button.config(state=tkinter.DISABLED)
         self._close_button.config(state=tkinter.DISABLED)
+        self._cancel_button.config(state=tkinter.NORMAL)
         
-        busy_state_id = self._busy_state_id
-        out_heap = []
+        if transform_run.msg_count is not None:
+            self._progressbar.config(
+                    mode='determinate', maximum=transform_run.msg_count, value=0)
+        else:
+            self._progressbar.config(mode='indeterminate', value=0)
         
-        def on_result(err, data):
-            self._tk_mt.push(lambda: self._on_transform_result(err, busy_state_id, out_heap, data))
+        busy_state_id = self._busy_state_id
         
         def on_done(err):
-            self._tk_mt.push(lambda: self._on_transform_done(err, busy_state_id, out_heap))
+            self._tk_mt.push(lambda: self._on_transform_done(err, busy_state_id, transform_run))
         
         make_world_news.make_world_news(
                 in_msg_list,
@@ -236,39 +414,100 @@ class MainWindow:
                 news_secret_key,
                 use_short=use_short,
                 other_word_func_factory=other_word_func_factory,
-                on_result=on_result,
+                cancel_token=transform_run.cancel_token,
+                on_begin=transform_run.put_read_error,
+                on_result=transform_run.put_result,
                 callback=on_done,
                 )
+        
+        self._root.after(RENDER_DELAY,
+                lambda: self._render_tick(busy_state_id, transform_run))
     
-    def _on_transform_result(self, err, busy_state_id, out_heap, data):
-        if not self._busy_state or busy_state_id != self._busy_state_id:
+    def _cancel_cmd(self):
+        # workers stop soon. results, which are ready, are kept
+        
+        if not self._busy_state or self._result_run is None or \
+                self._result_run.cancel_token.cancelled:
+            self._root.bell()
             return
         
-        if err is not None:
+        self._result_run.cancel_token.cancel()
+        self._cancel_button.config(state=tkinter.DISABLED)
+        self._set_status('Cancelling')
+    
+    def _render_results(self, transform_run):
+        # everything, what is ready, by one insert
+        
+        line_list = []
+        
+        while True:
+            try:
+                line_list.append(transform_run.line_deque.popleft())
+            except IndexError:
+                break
+        
+        if line_list:
+            self._text.config(state=tkinter.NORMAL)
+            self._text.insert(tkinter.END, ''.join(
+                    '{}\n'.format(line) for line in line_list))
+            self._text.config(state=tkinter.DISABLED)
+        
+        if transform_run.msg_count is not None:
+            self._progressbar.config(mode='determinate', value=transform_run.done_count)
+        else:
+            self._progressbar.step()
+    
+    def _render_tick(self, busy_state_id, transform_run):
+        if not self._busy_state or busy_state_id != self._busy_state_id:
             return
         
-        heapq.heappush(out_heap, (data.msg_id, data))
+        self._render_results(transform_run)
+        self._set_status('{}: {}/{} ({:.1f} msg/s)'.format(
+                'Cancelling' if transform_run.cancel_token.cancelled else 'Working',
+                transform_run.done_count,
+                transform_run.msg_count if transform_run.msg_count is not None else '?',
+                transform_run.get_rate(),
+                ))
+        
+        self._root.after(RENDER_DELAY,
+                lambda: self._render_tick(busy_state_id, transform_run))
     
-    def _on_transform_done(self, err, busy_state_id, out_heap):
+    def _on_transform_done(self, err, busy_state_id, transform_run):
         if not self._busy_state or busy_state_id != self._busy_state_id:
             return
         
         if err is not None:
             return
         
-        while True:
-            try:
-                msg_id, data = heapq.heappop(out_heap)
-            except IndexError:
-                break
-            
+        transform_run.reorder.finish()
+        
+        if transform_run.msg_count is None and \
+                not transform_run.cancel_token.cancelled:
+            transform_run.msg_count = transform_run.done_count
+        
+        self._render_results(transform_run)
+        
+        if transform_run.preview_full:
             self._text.config(state=tkinter.NORMAL)
-            self._text.insert(tkinter.END, '{}\n'.format(data.result))
+            self._text.insert(tkinter.END,
+                    '... (first {} of {} lines. whole result: Save Result As)\n'.format(
+                            transform_run.preview_count, transform_run.reorder.written))
             self._text.config(state=tkinter.DISABLED)
         
         self._busy_state = False
         self._busy_state_id = object()
-        self._set_status('Done')
+        self._cancel_button.config(state=tkinter.DISABLED)
+        
+        if transform_run.cancel_token.cancelled:
+            self._set_status('Cancelled ({} of {} messages are done)'.format(
+                    transform_run.reorder.written,
+                    transform_run.msg_count if transform_run.msg_count is not None else '?',
+                    ))
+        elif transform_run.error_count:
+            self._set_status('Done ({} of {} messages are failed)'.format(
+                    transform_run.error_count, transform_run.msg_count))
+        else:
+            self._set_status('Done')
         
         self._new_data_button.config(state=tkinter.NORMAL)
         self._copy_result_button.config(state=tkinter.NORMAL)
@@ -314,10 +553,59 @@ class MainWindow:
         self._text.insert(tkinter.END, content)
     
     def _copy_result_cmd(self):
-        if self._busy_state or not self._result_state:
+        if self._busy_state or not self._result_state or \
+                self._result_run.preview_full:
             self._root.bell()
             return
         
         content = self._text.get('1.0', tkinter.END).rstrip()
         self._root.clipboard_clear()
         self._root.clipboard_append(content)
+    
+    def _save_result_result(self, err, busy_state_id, result):
+        if self._busy_state or busy_state_id != self._busy_state_id or \
+                not self._result_state:
+            return
+        
+        if err or not result:
+            return
+        
+        out_path = str(result)
+        result_run = self._result_run
+        
+        self._busy_state = True
+        self._busy_state_id = object()
+        self._set_status('Saving')
+        busy_state_id = self._busy_state_id
+        
+        self._tk_mt.start_daemon(
+                lambda: result_run.save(out_path),
+                callback=lambda result, error: self._on_save_result_done(
+                        error, busy_state_id),
+                )
+    
+    def _on_save_result_done(self, err, busy_state_id):
+        if not self._busy_state or busy_state_id != self._busy_state_id:
+            return
+        
+        self._busy_state = False
+        self._busy_state_id = object()
+        
+        if err is not None:
+            self._root.bell()
+            self._set_status('Result is not saved')
+            return
+        
+        self._set_status('Result is saved')
+    
+    def _save_result_cmd(self):
+        if self._busy_state or not self._result_state:
+            self._root.bell()
+            return
+        
+        tk_async.tk_async(
+                self._root,
+                lambda: filedialog.asksaveasfilename(parent=self._root),
+                self._busy_state_id,
+                callback=self._save_result_result,
+                )
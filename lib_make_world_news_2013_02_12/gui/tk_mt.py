@@ -17,47 +17,107 @@
 
 assert str is not bytes
 
-import sys
+import sys, os
 import threading
 import queue
+import tkinter
 
 TK_PULL_DELAY = 100 # milliseconds
+DRAIN_BATCH_SIZE = 200 # callbacks per one wakeup
+WAKEUP_EVENT = '<<TkMtWakeup>>'
 
 DESTROY = object()
 
-# this is Multi-Thread support for Tk
+# this is Multi-Thread support for Tk.
+#
+# ``push()`` wakes Tk loop at once: by byte in pipe, which is watched by
+# ``createfilehandler()`` (where there is one), else by virtual event (if
+# Tcl is threaded, ``event_generate()`` may be called from any thread).
+# there is only one wakeup pending at a time. callbacks run by batches of
+# ``DRAIN_BATCH_SIZE``, and Tk handles its own events between batches.
+#
+# without pipe, queue is polled each ``TK_PULL_DELAY`` too: virtual event
+# is lost, when it is generated before main loop runs
 class TkMt:
     def __init__(self, root):
         self._root = root
         self._queue = queue.Queue()
         self._closed = False
+        self._wakeup_lock = threading.Lock()
+        self._wakeup_pending = False
+        self._wakeup_read_fd = None
+        self._wakeup_write_fd = None
+        self._use_event = False
+        
+        if hasattr(self._root.tk, 'createfilehandler'):
+            self._wakeup_read_fd, self._wakeup_write_fd = os.pipe()
+            os.set_blocking(self._wakeup_read_fd, False)
+            os.set_blocking(self._wakeup_write_fd, False)
+            self._root.tk.createfilehandler(
+                    self._wakeup_read_fd,
+                    tkinter.READABLE,
+                    lambda fd, mask: self._drain(),
+                    )
+            return
+        
+        if self._root.tk.eval('info exists tcl_platform(threaded)') == '1':
+            self._use_event = True
+            self._root.bind(WAKEUP_EVENT, lambda event: self._drain())
         
         self._root.after(TK_PULL_DELAY, self._pull_handle)
     
     def close(self):
         self._closed = True
+        
+        with self._wakeup_lock:
+            if self._wakeup_read_fd is not None:
+                self._root.tk.deletefilehandler(self._wakeup_read_fd)
+                os.close(self._wakeup_read_fd)
+                os.close(self._wakeup_write_fd)
+                self._wakeup_read_fd = None
+                self._wakeup_write_fd = None
     
     def _pull_handle(self):
         if self._closed:
             return
         
-        while True:
+        self._drain()
+        
+        self._root.after(TK_PULL_DELAY, self._pull_handle)
+    
+    def _drain(self):
+        if self._closed:
+            return
+        
+        with self._wakeup_lock:
+            self._wakeup_pending = False
+            
+            if self._wakeup_read_fd is not None:
+                try:
+                    os.read(self._wakeup_read_fd, 512)
+                except BlockingIOError:
+                    pass
+        
+        for callback_i in range(DRAIN_BATCH_SIZE):
             try:
                 f = self._queue.get_nowait()
             except queue.Empty:
-                break
-            else:
-                try:
-                    if f == DESTROY:
-                        self.close()
-                        self._root.destroy()
-                        return
-                    
-                    self._root.after_idle(f)
-                finally:
-                    self._queue.task_done()
+                return
+            
+            try:
+                if f == DESTROY:
+                    self.close()
+                    self._root.destroy()
+                    return
+                
+                f()
+            except Exception:
+                self._root.report_callback_exception(*sys.exc_info())
+            finally:
+                self._queue.task_done()
         
-        self._root.after(TK_PULL_DELAY, self._pull_handle)
+        # the rest is after events of Tk
+        self._root.after_idle(self._drain)
     
     # threadsafe function
     def push(self, callback):
@@ -67,6 +127,25 @@ class TkMt:
         assert callable(callback) or callback == DESTROY
         
         self._queue.put(callback)
+        
+        with self._wakeup_lock:
+            if self._wakeup_pending or self._closed:
+                return
+            
+            self._wakeup_pending = True
+            
+            if self._wakeup_write_fd is not None:
+                os.write(self._wakeup_write_fd, b'\0')
+                return
+        
+        if self._use_event:
+            # not under lock: from other thread, it waits for Tk loop
+            try:
+                self._root.event_generate(WAKEUP_EVENT, when='tail')
+            except (RuntimeError, tkinter.TclError):
+                # main loop is not running (yet or already). polling will
+                # find callback
+                pass
     
     # threadsafe function
     def push_destroy(self):
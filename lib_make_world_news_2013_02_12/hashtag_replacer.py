@@ -35,46 +35,85 @@ def create_hashtag_set(word_list):
     
     return frozenset(hashtag_set)
 
+# one word (``__call__()``)
+WORD_RE = re.compile(
+        r'^(?P<pre_word>\W*?)(?P<word>\w+?)(?P<post_word>\W*?)$',
+        flags=re.M | re.S,
+        )
+
+# all words of message cell at once (``replace_cell()``). words are separated
+# by ``' '``, as in ``make_world_news``
+CELL_RE = re.compile(
+        r'(?<![^ ])(?P<pre_word>[^\w ]*)(?P<word>\w+)(?P<post_word>[^\w ]*)(?![^ ])',
+        flags=re.S,
+        )
+
+URL_WORDS = ('http', 'https')
+
 class HashtagReplacer:
     def __init__(self, hashtag_set):
         self._hashtag_set = hashtag_set
         self._used = set()
     
-    # XXX! this function is NOT threadsafe. (and NOT NEED be threadsafe).
-    def __call__(self, word):
-        def replace_func(matchobj):
-            word_lower = matchobj.group('word').lower()
-            
-            if matchobj.group('pre_word').endswith('#'):
-                self._used.add(word_lower)
-                
-                return matchobj.group()
+    def _replace_func(self, matchobj):
+        pre_word, word, post_word = matchobj.groups()
+        word_lower = word.lower()
+        
+        if pre_word.endswith('#'):
+            self._used.add(word_lower)
             
-            if word_lower in self._hashtag_set and \
-                    word_lower not in self._used:
-                self._used.add(word_lower)
-                
-                return '{}#{}{}'.format(
-                        matchobj.group('pre_word'),
-                        matchobj.group('word'),
-                        matchobj.group('post_word'),
-                        )
+            return matchobj.group()
+        
+        if word_lower in self._hashtag_set and \
+                word_lower not in self._used:
+            self._used.add(word_lower)
             
+            return '{}#{}{}'.format(pre_word, word, post_word)
+        
+        return matchobj.group()
+    
+    def _replace_cell_func(self, matchobj):
+        pre_word, word, post_word = matchobj.groups()
+        
+        if not pre_word and word in URL_WORDS and post_word.startswith('://'):
+            # it is url (like ``http://``), which is not a word
             return matchobj.group()
         
-        return re.sub(
-                r'^(?P<pre_word>\W*?)(?P<word>\w+?)(?P<post_word>\W*?)$',
-                replace_func,
-                word,
-                flags=re.M | re.S,
-                )
+        word_lower = word.lower()
+        
+        if pre_word.endswith('#'):
+            self._used.add(word_lower)
+        elif word_lower in self._hashtag_set and \
+                word_lower not in self._used:
+            self._used.add(word_lower)
+            
+            return '{}#{}{}'.format(pre_word, word, post_word)
+        
+        return matchobj.group()
+    
+    # XXX! this function is NOT threadsafe. (and NOT NEED be threadsafe).
+    def __call__(self, word):
+        return WORD_RE.sub(self._replace_func, word)
+    
+    # XXX! this function is NOT threadsafe. (and NOT NEED be threadsafe).
+    def replace_cell(self, cell):
+        # the same as calling ``self(word)`` for each non-url word of
+        # ``cell.split(' ')``, but in one pass
+        
+        return CELL_RE.sub(self._replace_cell_func, cell)
 
-def create_word_func_factory(word_list):
-    hashtag_set = create_hashtag_set(word_list)
+class WordFuncFactory:
+    # it is a class (not a closure), to be picklable for process pool
+    
+    def __init__(self, hashtag_set):
+        self.hashtag_set = hashtag_set
     
-    def word_func_factory():
-        hr = HashtagReplacer(hashtag_set)
+    def __call__(self):
+        hr = HashtagReplacer(self.hashtag_set)
         
         return hr
+
+def create_word_func_factory(word_list):
+    hashtag_set = create_hashtag_set(word_list)
     
-    return word_func_factory
+    return WordFuncFactory(hashtag_set)
@@ -0,0 +1,246 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, time, socket
+from http import client as http_client
+from urllib import parse as url_parse
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_IDLE_TIMEOUT = 60.0 # seconds
+DEFAULT_TIMEOUT = 20.0 # seconds
+MAX_RESP_SIZE = 10000000
+
+# errors of reused (idle) connection, which was closed by server side
+DEAD_CONN_ERRORS = (
+        http_client.RemoteDisconnected,
+        http_client.BadStatusLine,
+        ConnectionResetError,
+        ConnectionAbortedError,
+        BrokenPipeError,
+        )
+
+class Aborted(IOError):
+    # request is failed by ``abort()``, not by server
+    pass
+
+class HttpPool:
+    # pool of HTTP/1.1 keep-alive connections. ``size`` is max count of idle
+    # connections, which are kept for each host.
+    #
+    # ``abort()`` makes requests in flight (and all next ones) fail at once,
+    # without waiting for their timeouts
+    
+    def __init__(self, size=None, idle_timeout=None):
+        if size is None:
+            size = DEFAULT_POOL_SIZE
+        if idle_timeout is None:
+            idle_timeout = DEFAULT_IDLE_TIMEOUT
+        
+        self._size = size
+        self._idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle_map = {}
+        self._busy_set = set()
+        self._connecting_set = set()
+        self._closed = False
+        self._aborted = False
+    
+    def _create_connection(self, address, timeout, source_address=None):
+        # like ``socket.create_connection()`` (it is used by ``http.client``),
+        # but socket is known to ``abort()`` before connect. so connect,
+        # which waits for not reachable host, is aborted too
+        
+        host, port = address
+        err = None
+        
+        for family, sock_type, proto, canon_name, sock_addr in \
+                socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            sock = socket.socket(family, sock_type, proto)
+            
+            with self._lock:
+                if self._aborted:
+                    sock.close()
+                    
+                    raise Aborted('requests are aborted')
+                
+                self._connecting_set.add(sock)
+            
+            try:
+                sock.settimeout(timeout)
+                
+                if source_address:
+                    sock.bind(source_address)
+                
+                sock.connect(sock_addr)
+                
+                return sock
+            except OSError as e:
+                sock.close()
+                
+                if self._aborted:
+                    raise Aborted('requests are aborted')
+                
+                err = e
+            finally:
+                with self._lock:
+                    self._connecting_set.discard(sock)
+        
+        if err is None:
+            err = OSError('getaddrinfo returns an empty list')
+        
+        raise err
+    
+    def _get_conn(self, host_key, timeout):
+        now = time.monotonic()
+        
+        with self._lock:
+            idle_list = self._idle_map.get(host_key)
+            
+            while idle_list:
+                conn, last_used = idle_list.pop()
+                
+                if now - last_used < self._idle_timeout:
+                    conn.timeout = timeout
+                    
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    
+                    return conn, True
+                
+                conn.close()
+        
+        scheme, netloc = host_key
+        
+        if scheme == 'https':
+            conn = http_client.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            conn = http_client.HTTPConnection(netloc, timeout=timeout)
+        
+        conn._create_connection = self._create_connection
+        
+        return conn, False
+    
+    def _put_conn(self, host_key, conn):
+        with self._lock:
+            if self._closed:
+                conn.close()
+                return
+            
+            idle_list = self._idle_map.setdefault(host_key, [])
+            
+            if len(idle_list) >= self._size:
+                conn.close()
+                return
+            
+            idle_list.append((conn, time.monotonic()))
+    
+    # threadsafe function
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        if headers is None:
+            headers = {}
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT
+        
+        scheme, netloc, path, query, fragment = url_parse.urlsplit(url)
+        host_key = scheme, netloc
+        selector = '{}?{}'.format(path or '/', query) if query else path or '/'
+        
+        while True:
+            if self._aborted:
+                raise Aborted('requests are aborted')
+            
+            conn, reused = self._get_conn(host_key, timeout)
+            
+            try:
+                if conn.sock is None:
+                    # connected here, so that ``abort()`` could find socket
+                    conn.connect()
+                
+                with self._lock:
+                    if self._aborted:
+                        raise Aborted('requests are aborted')
+                    
+                    self._busy_set.add(conn)
+                
+                try:
+                    conn.request(method, selector, body=body, headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read(MAX_RESP_SIZE)
+                finally:
+                    with self._lock:
+                        self._busy_set.discard(conn)
+            except Aborted:
+                conn.close()
+                
+                raise
+            except DEAD_CONN_ERRORS:
+                conn.close()
+                
+                if self._aborted:
+                    # socket is shut down by ``abort()``
+                    raise Aborted('requests are aborted')
+                
+                if reused:
+                    # reconnecting transparently
+                    continue
+                
+                raise
+            except:
+                conn.close()
+                
+                if self._aborted:
+                    raise Aborted('requests are aborted')
+                
+                raise
+            
+            if resp.will_close or not resp.isclosed():
+                conn.close()
+            else:
+                self._put_conn(host_key, conn)
+            
+            return resp.status, data
+    
+    def close(self):
+        with self._lock:
+            self._closed = True
+            
+            for idle_list in self._idle_map.values():
+                for conn, last_used in idle_list:
+                    conn.close()
+            
+            self._idle_map.clear()
+    
+    # threadsafe function
+    def abort(self):
+        with self._lock:
+            self._aborted = True
+            busy_list = list(self._busy_set)
+            sock_list = list(self._connecting_set)
+        
+        self.close()
+        
+        sock_list.extend(conn.sock for conn in busy_list if conn.sock is not None)
+        
+        for sock in sock_list:
+            try:
+                # blocked ``connect()`` or ``recv()`` of other thread returns
+                # at once
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
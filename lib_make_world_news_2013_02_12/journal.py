@@ -0,0 +1,118 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, time, json
+
+DEFAULT_FLUSH_COUNT = 100 # entries
+DEFAULT_FLUSH_DELAY = 1.0 # seconds
+
+def read_journal(path):
+    # returns dict ``msg_id -> result``. missing file is empty journal.
+    # broken line (process was killed while writing it) is ignored
+    
+    done_map = {}
+    
+    try:
+        fd = open(path, encoding='utf-8', errors='replace')
+    except FileNotFoundError:
+        return done_map
+    
+    with fd:
+        for line in fd:
+            try:
+                msg_id, result = json.loads(line)
+            except ValueError:
+                continue
+            
+            done_map[msg_id] = result
+    
+    return done_map
+
+def resume(in_msg_list, out_buf, done_map):
+    # like ``reorder_buffer.ReorderBuffer.throttle()``, but results of
+    # messages from ``done_map`` are put to ``out_buf`` at once, and only
+    # other messages are yielded, as ``(msg_id, in_msg)``
+    
+    for msg_id, in_msg in enumerate(in_msg_list):
+        out_buf.wait(msg_id)
+        
+        result = done_map.pop(msg_id, None)
+        
+        if result is not None:
+            out_buf.put(msg_id, result)
+            
+            continue
+        
+        yield msg_id, in_msg
+
+class Journal:
+    # append-only file of completed ``(msg_id, result)``. entries are
+    # written by batches: when ``flush_count`` entries is collected, or when
+    # ``flush_delay`` is expired since previous write
+    
+    def __init__(self, path, append=None, flush_count=None, flush_delay=None):
+        if append is None:
+            append = False
+        if flush_count is None:
+            flush_count = DEFAULT_FLUSH_COUNT
+        if flush_delay is None:
+            flush_delay = DEFAULT_FLUSH_DELAY
+        
+        self.path = path
+        self._flush_count = flush_count
+        self._flush_delay = flush_delay
+        self._lock = threading.Lock()
+        self._fd = open(path, 'a' if append else 'w', encoding='utf-8', newline='\n')
+        self._pending = []
+        
+        if append and self._fd.tell() > 0:
+            # broken last line must not be glued with our first line
+            with open(path, 'rb') as check_fd:
+                check_fd.seek(-1, 2)
+                
+                if check_fd.read(1) != b'\n':
+                    self._fd.write('\n')
+        self._flush_time = time.monotonic()
+    
+    # threadsafe function
+    def put(self, msg_id, result):
+        with self._lock:
+            self._pending.append(json.dumps((msg_id, result), ensure_ascii=False))
+            
+            if len(self._pending) >= self._flush_count or \
+                    time.monotonic() - self._flush_time >= self._flush_delay:
+                self._flush()
+    
+    def _flush(self):
+        if self._pending:
+            self._fd.write('{}\n'.format('\n'.join(self._pending)))
+            self._fd.flush()
+            self._pending = []
+        
+        self._flush_time = time.monotonic()
+    
+    # threadsafe function
+    def flush(self):
+        with self._lock:
+            self._flush()
+    
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._fd.close()
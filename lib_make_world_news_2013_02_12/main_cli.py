@@ -17,64 +17,632 @@
 
 assert str is not bytes
 
-import threading, argparse, configparser, os.path, base64, heapq
-from . import fix_url, read_list, hashtag_replacer, make_world_news
+import sys, threading, argparse, os, os.path, time, signal
+from . import read_list, make_world_news, reorder_buffer, run_config
+from . import short_cache, url_memo, journal, service
+from . import async_engine, process_engine, adaptive_limit, stats, progress_log
+from . import chunk_dispatch, cancel
+
+ENGINE_LIST = ('threads', 'asyncio', 'processes')
+DEFAULT_ENGINE = 'threads'
+CANCELLED_EXIT_STATUS = 130 # as of shell for process, killed by ``SIGINT``
 
 class UserError(Exception):
     pass
 
-def on_begin(err, ui_lock, data):
-    with ui_lock:
-        if err is not None:
-            print('error state')
+class RunSummary:
+    def __init__(self, memo, short_cache_obj=None, limiter=None, bucket=None,
+            stats_obj=None, cancel_token=None):
+        self.memo = memo
+        self.short_cache_obj = short_cache_obj
+        self.limiter = limiter
+        self.bucket = bucket
+        self.stats_obj = stats_obj
+        self.cancel_token = cancel_token
+        self.shown_limit = None
+        self.pass_count = 0
+        self.error_count = 0
+        self.cancelled_count = 0
+        self.resumed_count = 0
+        self.failed_job_count = 0
+        self.write_failed = False
+        self.start_time = time.monotonic()
+        self.status_time = self.start_time
+        self.status_count = 0
+
+class FileJob:
+    # one pair of input and output files. all jobs of run share one engine
+    # (workers, caches); each job has its own ordered output and summary
+    
+    def __init__(self, in_path, out_path, journal_path, tag=None):
+        self.in_path = in_path
+        self.out_path = out_path
+        self.journal_path = journal_path
+        self.tag = tag
+        self.out_fd = None
+        self.out_buf = None
+        self.journal_obj = None
+        self.done_map = None
+        self.read_count = 0
+        self.read_done = False
+        self.pass_count = 0
+        self.error_count = 0
+        self.cancelled_count = 0
+        self.resumed_count = 0
+        self.read_error = None
+        self.write_error = None
+        self.finished = False
+    
+    @property
+    def done_count(self):
+        return self.pass_count + self.error_count + self.cancelled_count
+    
+    def get_msg_label(self, msg_id):
+        if self.tag is None:
+            return repr(msg_id)
+        
+        return '{}:{!r}'.format(self.tag, msg_id)
+    
+    def start(self, window, use_journal, resume, stats_obj=None, on_write_error=None):
+        # standard output can not be rewritten. so it has no journal.
+        #
+        # ``on_write_error(job)`` is called once, when output is failed
+        # (for example, reader of pipe is gone). results are not written
+        # after it
+        
+        if self.out_path == read_list.STD_PATH:
+            use_journal = resume = False
+        
+        if resume:
+            self.done_map = journal.read_journal(self.journal_path)
+        else:
+            self.done_map = {}
+        
+        self.resumed_count = len(self.done_map)
+        
+        if self.out_path == read_list.STD_PATH:
+            self.out_fd = open(
+                    sys.stdout.fileno(), 'w', encoding='utf-8', newline='\n',
+                    closefd=False)
+        else:
+            self.out_fd = open(self.out_path, 'w', encoding='utf-8', newline='\n')
+        self.out_buf = reorder_buffer.ReorderBuffer(
+                lambda result: self.write(result, stats_obj, on_write_error),
+                window=window,
+                )
+        
+        if use_journal:
+            self.journal_obj = journal.Journal(self.journal_path, append=resume)
+    
+    def write(self, result, stats_obj, on_write_error):
+        # is called by ``out_buf`` (under its lock)
+        
+        if self.write_error is not None:
+            return
+        
+        try:
+            write_result(self.out_fd, result, stats_obj=stats_obj)
+        except OSError as e:
+            self.write_error = e
+            
+            if on_write_error is not None:
+                on_write_error(self)
+    
+    def read(self):
+        # yields ``(msg_id, in_msg)`` of messages, which are not in journal
+        
+        return journal.resume(
+                read_list.read_list(self.in_path), self.out_buf, self.done_map)
+    
+    def finish(self, ok):
+        self.finished = True
+        
+        if self.journal_obj is not None:
+            self.journal_obj.close()
+        
+        if self.out_fd is None:
+            # job is failed before its output is opened
             return
         
-        print('[{!r}] begin: {!r}'.format(data.msg_id, data.in_msg))
+        if ok:
+            self.out_buf.finish()
+            
+            if self.journal_obj is not None and self.read_done and \
+                    self.read_error is None and self.write_error is None and \
+                    not self.error_count and not self.cancelled_count:
+                # everything is in output file. nothing to resume
+                os.remove(self.journal_path)
+        
+        try:
+            self.out_fd.close()
+        except OSError:
+            if self.write_error is None:
+                raise
+
+def get_job_list(path_list, journal_path=None):
+    # ``path_list`` is ``[in_path, out_path, ...]``. a directory as
+    # ``in_path`` means each file of it, with the same name in directory
+    # ``out_path``
+    
+    if len(path_list) % 2:
+        raise UserError('count of input and output paths is odd')
+    
+    path_pair_list = []
+    
+    for in_path, out_path in zip(path_list[0::2], path_list[1::2]):
+        if in_path == read_list.STD_PATH:
+            path_pair_list.append((in_path, out_path))
+            
+            continue
+        
+        if not os.path.isdir(in_path):
+            if not os.path.isfile(in_path):
+                raise UserError('input file is not found: {!r}'.format(in_path))
+            
+            path_pair_list.append((in_path, out_path))
+            
+            continue
+        
+        if os.path.abspath(in_path) == os.path.abspath(out_path):
+            raise UserError('input and output directories are the same: {!r}'.format(
+                    in_path))
+        
+        os.makedirs(out_path, exist_ok=True)
+        
+        for name in sorted(os.listdir(in_path)):
+            if name.startswith('.') or not os.path.isfile(os.path.join(in_path, name)):
+                continue
+            
+            path_pair_list.append((
+                    os.path.join(in_path, name),
+                    os.path.join(out_path, name),
+                    ))
+    
+    if journal_path is not None and len(path_pair_list) != 1:
+        raise UserError('journal path may be given only for one output')
+    
+    if [in_path for in_path, out_path in path_pair_list].count(read_list.STD_PATH) > 1:
+        raise UserError('standard input is used more than once')
+    if [out_path for in_path, out_path in path_pair_list].count(read_list.STD_PATH) > 1:
+        raise UserError('standard output is used more than once')
+    
+    job_list = []
+    
+    for in_path, out_path in path_pair_list:
+        job_list.append(FileJob(
+                in_path,
+                out_path,
+                journal_path if journal_path is not None
+                        else '{}.journal'.format(out_path),
+                tag=in_path if len(path_pair_list) > 1 else None,
+                ))
+    
+    return job_list
 
-def on_result(err, ui_lock, out_heap, data):
+def finish_job(log, summary, job, ok):
+    job.finish(ok)
+    summary.resumed_count += job.resumed_count
+    
+    if job.tag is None:
+        return
+    
+    line = '{} -> {}: pass: {}, error: {}'.format(
+            job.in_path, job.out_path, job.pass_count, job.error_count)
+    
+    if job.read_error is not None:
+        line = '{}, input is failed'.format(line)
+    
+    if job.cancelled_count:
+        line = '{}, cancelled: {}'.format(line, job.cancelled_count)
+    
+    if job.resumed_count:
+        line = '{}, resumed from journal: {}'.format(line, job.resumed_count)
+    
+    log.info(line)
+
+def read_jobs(ui_lock, log, summary, job_list, id_map, window, use_journal, resume):
+    # messages of all jobs, one by one. ``id_map`` gets ``(job, msg_id)``
+    # of each yielded message, by its index in whole run.
+    #
+    # input files are opened lazily. if one of them can not be opened or
+    # read, its job is failed (messages, which are already read, are
+    # finished as usual), and the next job goes on
+    
+    run_msg_id = 0
+    
+    for job in job_list:
+        try:
+            job.start(
+                    window,
+                    use_journal,
+                    resume,
+                    stats_obj=summary.stats_obj,
+                    on_write_error=lambda job: on_write_error(log, summary, job),
+                    )
+            msg_iter = job.read()
+        except Exception as e:
+            job.read_error = e
+            msg_iter = iter(())
+        
+        while job.read_error is None:
+            try:
+                msg_id, in_msg = next(msg_iter)
+            except StopIteration:
+                break
+            except Exception as e:
+                job.read_error = e
+                break
+            
+            id_map[run_msg_id] = job, msg_id
+            run_msg_id += 1
+            job.read_count += 1
+            
+            yield in_msg
+        
+        with ui_lock:
+            if job.done_map is not None:
+                job.resumed_count -= len(job.done_map)
+            
+            job.read_done = True
+            
+            if job.read_error is not None:
+                summary.failed_job_count += 1
+                log.error('{} -> {}: input is failed: {}: {}'.format(
+                        job.in_path, job.out_path,
+                        type(job.read_error).__name__, job.read_error))
+            
+            if job.done_count == job.read_count:
+                finish_job(log, summary, job, True)
+
+def get_status_line(summary):
+    # periodic progress line. is called by writer thread of ``progress_log``
+    
+    now = time.monotonic()
+    done_count = summary.pass_count + summary.error_count + summary.cancelled_count
+    rate = (done_count - summary.status_count) / max(now - summary.status_time, 1e-9)
+    summary.status_time = now
+    summary.status_count = done_count
+    
+    line = 'progress: pass: {}, error: {}, {:.1f} msg/s, elapsed: {:.0f} s'.format(
+            summary.pass_count,
+            summary.error_count,
+            rate,
+            now - summary.start_time,
+            )
+    
+    if summary.cancelled_count:
+        line = '{}, cancelled: {}'.format(line, summary.cancelled_count)
+    
+    if summary.limiter is not None:
+        line = '{}, short link concurrency limit: {}'.format(line, summary.limiter.limit)
+    
+    return line
+
+def on_begin(err, log, id_map, data):
+    if err is not None:
+        log.error('error state')
+        return
+    
+    # ``data.msg_id`` of engine is index in whole run
+    data.job, data.msg_id = id_map.pop(data.msg_id)
+    
+    if log.per_message:
+        log.message('[{}] begin: {!r}'.format(
+                data.job.get_msg_label(data.msg_id), data.in_msg))
+
+def log_limit(log, summary):
+    # logs limit of short link requests in flight, when it is changed
+    
+    if summary.limiter is None or summary.limiter.limit == summary.shown_limit:
+        return
+    
+    summary.shown_limit = summary.limiter.limit
+    log.message('short link concurrency limit: {}'.format(summary.shown_limit))
+
+def count_result(ui_lock, log, summary, job, result):
+    # ``result`` is ``'pass'``, ``'error'`` or ``'cancelled'``
+    
     with ui_lock:
-        if err is not None:
-            print('[{!r}] error: {!r}: {!r}: {}'.format(
-                    data.msg_id, data.in_msg,
-                    err[0], err[1]))
-            return
+        if result == 'pass':
+            summary.pass_count += 1
+            job.pass_count += 1
+        elif result == 'error':
+            summary.error_count += 1
+            job.error_count += 1
+        else:
+            summary.cancelled_count += 1
+            job.cancelled_count += 1
         
-        heapq.heappush(out_heap, (data.msg_id, data))
+        if log.per_message:
+            log_limit(log, summary)
+        
+        if job.read_done and not job.finished and job.done_count == job.read_count:
+            finish_job(log, summary, job, True)
+
+def on_result(err, ui_lock, log, summary, data):
+    job = data.job
+    
+    if err is not None and summary.cancel_token is not None and \
+            summary.cancel_token.cancelled:
+        # after cancel, failures are caused by it (for example, by aborted
+        # requests). message is not logged: it is not processed yet
+        job.out_buf.put(data.msg_id, None)
+        
+        if summary.stats_obj is not None:
+            summary.stats_obj.count('messages', label=('result', 'cancelled'))
+        
+        count_result(ui_lock, log, summary, job, 'cancelled')
+        return
+    
+    if err is not None:
+        job.out_buf.put(data.msg_id, None)
         
-        print('[{!r}] pass: {!r}'.format(data.msg_id, data.in_msg))
+        if summary.stats_obj is not None:
+            summary.stats_obj.count('messages', label=('result', 'error'))
+            summary.stats_obj.count('errors', label=('type', err[0].__name__))
+        
+        log.error('[{}] error: {!r}: {!r}: {}'.format(
+                job.get_msg_label(data.msg_id), data.in_msg,
+                err[0], err[1]))
+        count_result(ui_lock, log, summary, job, 'error')
+        return
+    
+    if job.journal_obj is not None:
+        job.journal_obj.put(data.msg_id, data.result)
+    
+    job.out_buf.put(data.msg_id, data.result)
+    
+    if summary.stats_obj is not None:
+        summary.stats_obj.count('messages', label=('result', 'pass'))
+    
+    if log.per_message:
+        log.message('[{}] pass: {!r}'.format(
+                job.get_msg_label(data.msg_id), data.in_msg))
+    
+    count_result(ui_lock, log, summary, job, 'pass')
+
+def on_write_error(log, summary, job):
+    # output is lost (broken pipe, full disk, ...). the rest of run is
+    # useless: it is cancelled, as by ^C. ``ui_lock`` is not taken here:
+    # it is called under lock of ``job.out_buf``
+    
+    summary.write_failed = True
+    
+    if isinstance(job.write_error, BrokenPipeError):
+        log.error('{}: output is closed. cancelling...'.format(job.out_path))
+    else:
+        log.error('{}: output is failed: {}. cancelling...'.format(
+                job.out_path, job.write_error))
+    
+    if summary.cancel_token is not None:
+        # callbacks of token take locks, which may be held by caller
+        threading.Thread(target=summary.cancel_token.cancel, daemon=True).start()
 
-def on_done(err, ui_lock, out_heap, out_fd, done_event):
+def write_result(out_fd, result, stats_obj=None):
+    start_time = time.perf_counter()
+    
+    out_fd.write('{}\n'.format(result))
+    out_fd.flush()
+    
+    if stats_obj is not None:
+        stats_obj.add_time('write', time.perf_counter() - start_time)
+
+def update_stats(summary):
+    # copies counters of other objects to ``summary.stats_obj``
+    
+    stats_obj = summary.stats_obj
+    
+    if summary.resumed_count:
+        stats_obj.set('resumed_messages', summary.resumed_count)
+    
+    if summary.memo is not None:
+        stats_obj.set('memo_hits', summary.memo.hit_count)
+        stats_obj.set('memo_avoided_requests', summary.memo.wait_count)
+    
+    if summary.short_cache_obj is not None:
+        stats_obj.set('short_cache_hits', summary.short_cache_obj.hit_count)
+        stats_obj.set('short_cache_misses', summary.short_cache_obj.miss_count)
+    
+    if summary.limiter is not None:
+        stats_obj.set('short_concurrency_limit', summary.limiter.limit)
+    
+    if summary.bucket is not None:
+        stats_obj.set('short_rate_limit', summary.bucket.rate)
+
+def write_stats(summary, stats_json_path, stats_prom_path):
+    update_stats(summary)
+    
+    if stats_json_path is not None:
+        summary.stats_obj.write_json(stats_json_path)
+    
+    if stats_prom_path is not None:
+        summary.stats_obj.write_prometheus(stats_prom_path)
+
+def stats_thread(summary, stats_prom_path, interval, stop_event):
+    # rewrites Prometheus text file periodically, for long runs
+    
+    while not stop_event.wait(interval):
+        write_stats(summary, None, stats_prom_path)
+
+def log_summary(log, summary):
+    log.info('messages: pass: {}, error: {}'.format(
+            summary.pass_count, summary.error_count))
+    
+    if summary.cancelled_count:
+        log.info('messages: cancelled: {}'.format(summary.cancelled_count))
+    
+    if summary.resumed_count:
+        log.info('messages: resumed from journal: {}'.format(summary.resumed_count))
+    
+    if summary.memo is not None:
+        log.info('url memo: hits: {}, avoided duplicate requests: {}'.format(
+                summary.memo.hit_count, summary.memo.wait_count))
+    
+    if summary.short_cache_obj is not None:
+        log.info('short cache: hits: {}, misses: {}'.format(
+                summary.short_cache_obj.hit_count,
+                summary.short_cache_obj.miss_count))
+    
+    if summary.limiter is not None:
+        log.info('short link concurrency limit: last: {}, lowest: {}, highest: {}, '
+                'cuts: {}'.format(
+                        summary.limiter.limit,
+                        summary.limiter.lowest_limit,
+                        summary.limiter.highest_limit,
+                        summary.limiter.cut_count))
+    
+    if summary.bucket is not None:
+        log.info('short link rate limit: {}/s, waited requests: {} of {}, '
+                'waited seconds: {:.1f}'.format(
+                        summary.bucket.rate,
+                        summary.bucket.wait_count,
+                        summary.bucket.request_count,
+                        summary.bucket.wait_seconds))
+
+def on_done(err, ui_lock, log, job_list, summary, done_event):
     with ui_lock:
         try:
+            for job in job_list:
+                if job.out_fd is not None and not job.finished:
+                    finish_job(log, summary, job, err is None)
+            
             if err is not None:
-                print('error state')
+                log.error('error state')
                 return
             
-            print('writing...')
-            
-            while True:
-                try:
-                    msg_id, data = heapq.heappop(out_heap)
-                except IndexError:
-                    break
-                
-                out_fd.write('{}\n'.format(data.result))
-                out_fd.flush()
+            log_summary(log, summary)
             
-            print('done!')
+            if summary.write_failed:
+                log.info('cancelled! output is failed')
+            elif summary.cancel_token is not None and summary.cancel_token.cancelled:
+                if any(job.journal_obj is not None for job in job_list):
+                    log.info('cancelled! results, which are ready, are written. '
+                            'the rest may be done by --resume')
+                else:
+                    log.info('cancelled! results, which are ready, are written')
+            elif summary.failed_job_count:
+                log.info('done, but input of {} file(s) is failed!'.format(
+                        summary.failed_job_count))
+            else:
+                log.info('done!')
         finally:
             done_event.set()
 
+def on_sigint(log, cancel_token, signum, frame):
+    # the first ^C cancels run. the second one kills process, as usual
+    
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    log.info('cancelling... (^C again to kill)')
+    
+    # callbacks of token take locks, which may be held by interrupted code
+    threading.Thread(target=cancel_token.cancel, daemon=True).start()
+
 def main():
+    if sys.argv[1:2] == ['serve']:
+        service.main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
             description='utility for creating new pages (getting links) '
-                    'for web-sites of class ``world-news``.',
+                    'for web-sites of class ``world-news``. '
+                    'see also ``make-world-news serve --help``',
             )
     parser.add_argument(
             '--use-short',
             action='store_true',
             help='use short links',
             )
+    parser.add_argument(
+            '--window',
+            metavar='WINDOW',
+            type=int,
+            help='max count of messages in flight (not yet written in order). '
+                    'default is {}'.format(reorder_buffer.DEFAULT_WINDOW),
+            )
+    parser.add_argument(
+            '--engine',
+            choices=ENGINE_LIST,
+            default=DEFAULT_ENGINE,
+            help='``threads`` -- a thread per each worker. '
+                    '``asyncio`` -- one event loop for all workers '
+                    '(allows thousands of in-flight short link requests). '
+                    '``processes`` -- a process per each CPU core '
+                    '(for long links only). '
+                    'default is {}'.format(DEFAULT_ENGINE),
+            )
+    parser.add_argument(
+            '--conc',
+            metavar='CONCURRENCY',
+            type=int,
+            help='count of concurrent workers. default is {} for ``threads``, '
+                    '{} for ``asyncio`` and count of CPU cores for '
+                    '``processes``'.format(
+                            make_world_news.DEFAULT_CONCURRENCY,
+                            async_engine.DEFAULT_CONCURRENCY,
+                            ),
+            )
+    parser.add_argument(
+            '--max-conc',
+            metavar='MAX-CONCURRENCY',
+            type=int,
+            help='upper bound of adaptive limit of short link requests in flight '
+                    '(the limit starts from CONCURRENCY). '
+                    'default is {} * CONCURRENCY'.format(
+                            adaptive_limit.DEFAULT_MAX_FACTOR),
+            )
+    parser.add_argument(
+            '--fixed-conc',
+            action='store_true',
+            help='do not adapt count of short link requests in flight to '
+                    'server load',
+            )
+    parser.add_argument(
+            '--journal',
+            metavar='JOURNAL-PATH',
+            help='path to journal of completed messages (for ``--resume``). '
+                    'default is OUTPUT-MESSAGES-PATH.journal (for each output). '
+                    'the journal is removed after run without errors',
+            )
+    parser.add_argument(
+            '--no-journal',
+            action='store_true',
+            help='do not write journal',
+            )
+    parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='do not process again messages from journal of previous '
+                    '(interrupted) run with the same input',
+            )
+    parser.add_argument(
+            '--verbosity',
+            choices=progress_log.VERBOSITY_LIST,
+            default=progress_log.DEFAULT_VERBOSITY,
+            help='``messages`` -- line per message. '
+                    '``progress`` -- counts and rate once per second. '
+                    '``errors`` -- failed messages only. '
+                    'default is {}'.format(progress_log.DEFAULT_VERBOSITY),
+            )
+    parser.add_argument(
+            '--stats-json',
+            metavar='STATS-JSON-PATH',
+            help='path to JSON file with metrics of run (time of stages, '
+                    'counters, latency histogram of short link requests). '
+                    'it is written at the end of run',
+            )
+    parser.add_argument(
+            '--stats-prom',
+            metavar='STATS-PROMETHEUS-PATH',
+            help='path to Prometheus text format file with the same metrics. '
+                    'it is rewritten periodically during run',
+            )
+    parser.add_argument(
+            '--stats-interval',
+            metavar='SECONDS',
+            type=float,
+            help='period of rewriting of STATS-PROMETHEUS-PATH. '
+                    'default is {}'.format(stats.DEFAULT_PROMETHEUS_INTERVAL),
+            )
     parser.add_argument(
             'cfg',
             metavar='CONFIG-PATH',
@@ -83,12 +651,25 @@ def main():
     parser.add_argument(
             'in_msgs',
             metavar='INPUT-MESSAGES-PATH',
-            help='path to input news messages (with original urls) list file',
+            help='path to input news messages (with original urls) list file. '
+                    '``-`` is standard input',
             )
     parser.add_argument(
             'out',
             metavar='OUTPUT-MESSAGES-PATH',
-            help='path to output result messages (with urls) list file',
+            help='path to output result messages (with urls) list file. '
+                    '``-`` is standard output (then progress goes to standard '
+                    'error output). results are written as soon as they are '
+                    'ready in order',
+            )
+    parser.add_argument(
+            'more_paths',
+            metavar='MORE-PATHS',
+            nargs='*',
+            help='more pairs of input and output paths, processed by the same '
+                    'workers. input path may be directory: then each its file '
+                    'is processed to file with the same name in output '
+                    'directory',
             )
     args = parser.parse_args()
     
@@ -98,44 +679,194 @@ def main():
         raise UserError('args.in_msgs is None')
     if args.out is None:
         raise UserError('args.out is None')
+    if args.window is not None and args.window <= 0:
+        raise UserError('args.window <= 0')
+    if args.conc is not None and args.conc <= 0:
+        raise UserError('args.conc <= 0')
+    if args.max_conc is not None and args.max_conc <= 0:
+        raise UserError('args.max_conc <= 0')
+    if args.max_conc is not None and args.conc is not None and \
+            args.max_conc < args.conc:
+        raise UserError('args.max_conc < args.conc')
+    if args.stats_interval is not None and args.stats_interval <= 0:
+        raise UserError('args.stats_interval <= 0')
+    if args.resume and args.no_journal:
+        raise UserError('args.resume and args.no_journal')
+    if args.use_short and args.engine == 'processes':
+        raise UserError('engine ``processes`` does not support short links')
     
-    cfg = configparser.ConfigParser(
-            interpolation=configparser.ExtendedInterpolation())
-    with open(args.cfg, encoding='utf-8', errors='replace') as cfg_fd:
-        cfg.read_file(cfg_fd)
+    job_list = get_job_list(
+            [args.in_msgs, args.out] + args.more_paths,
+            journal_path=args.journal,
+            )
     
-    site_url = cfg.get('core', 'site_url')
-    site_url = fix_url.fix_url(site_url)
+    cfg, site_url, news_secret_key, other_word_func_factory = \
+            run_config.read_config(args.cfg)
     
-    news_secret_key_b64 = cfg.get('core', 'news_secret_key')
-    news_secret_key = base64.b64decode(news_secret_key_b64.encode())
+    if args.stats_json is not None or args.stats_prom is not None:
+        stats_obj = stats.Stats()
+    else:
+        stats_obj = None
     
-    if cfg.has_option('core', 'hashtag_list'):
-        hashtag_list_path = os.path.join(
-                os.path.dirname(args.cfg),
-                cfg.get('core', 'hashtag_list'),
-                )
-        other_word_func_factory = hashtag_replacer.create_word_func_factory(
-                read_list.read_list(hashtag_list_path, read_words=True),
-                )
+    if args.use_short and not args.fixed_conc:
+        limiter = run_config.create_limiter(cfg, args.engine, args.conc, args.max_conc)
+    else:
+        limiter = None
+    
+    if args.use_short:
+        bucket = run_config.create_rate_limit(cfg)
+    else:
+        bucket = None
+    
+    if args.use_short:
+        short_func, short_pool = run_config.create_short_func(
+                cfg, site_url, args.engine, args.conc, limiter=limiter,
+                bucket=bucket, stats_obj=stats_obj)
+    else:
+        short_func = None
+        short_pool = None
+    
+    if args.use_short:
+        short_cache_obj = run_config.create_short_cache(cfg, args.cfg)
+    else:
+        short_cache_obj = None
+    
+    if short_cache_obj is not None:
+        if args.engine == 'asyncio':
+            short_func = short_cache.AsyncCachedShortener(short_func, short_cache_obj, site_url)
+        else:
+            short_func = short_cache.CachedShortener(short_func, short_cache_obj, site_url)
+    
+    if args.window is not None:
+        window = args.window
     else:
-        other_word_func_factory = None
+        window = reorder_buffer.DEFAULT_WINDOW
+    
+    if args.engine == 'processes':
+        # each worker process has its own memo. stages of workers are
+        # not measured
+        memo = None
+        make_world_news_func = process_engine.make_world_news_processes
+        engine_kwargs = {
+                'chunk_size': min(process_engine.DEFAULT_CHUNK_SIZE, window),
+                }
+    else:
+        memo = url_memo.UrlMemo()
+        
+        if args.engine == 'asyncio':
+            make_world_news_func = async_engine.make_world_news_async
+        else:
+            make_world_news_func = make_world_news.make_world_news
+        
+        engine_kwargs = {
+                'short_func': short_func,
+                'memo': memo,
+                'limiter': limiter,
+                'stats': stats_obj,
+                }
+        
+        if args.engine == 'threads':
+            # a worker must not wait for window, holding its own messages
+            engine_kwargs['max_chunk_size'] = min(
+                    chunk_dispatch.DEFAULT_MAX_CHUNK_SIZE, window)
+    
+    cancel_token = cancel.CancelToken()
+    engine_kwargs['cancel_token'] = cancel_token
+    
+    if short_pool is not None:
+        cancel_token.add_callback(short_pool.abort)
+    
+    if bucket is not None:
+        cancel_token.add_callback(bucket.abort)
     
     ui_lock = threading.RLock()
+    summary = RunSummary(
+            memo,
+            short_cache_obj=short_cache_obj,
+            limiter=limiter,
+            bucket=bucket,
+            stats_obj=stats_obj,
+            cancel_token=cancel_token,
+            )
+    if any(job.out_path == read_list.STD_PATH for job in job_list):
+        log_fd = sys.stderr
+    else:
+        log_fd = sys.stdout
     
-    in_msg_list = read_list.read_list(args.in_msgs)
-    out_heap = []
-    
-    with open(args.out, 'w', encoding='utf-8', newline='\n') as out_fd:
-        done_event = threading.Event()
-        make_world_news.make_world_news(
-                in_msg_list,
-                site_url,
-                news_secret_key,
-                use_short=args.use_short,
-                other_word_func_factory=other_word_func_factory,
-                on_begin=lambda err, data: on_begin(err, ui_lock, data),
-                on_result=lambda err, data: on_result(err, ui_lock, out_heap, data),
-                callback=lambda err: on_done(err, ui_lock, out_heap, out_fd, done_event),
-                )
-        done_event.wait()
+    log = progress_log.ProgressLog(
+            verbosity=args.verbosity,
+            status_func=lambda: get_status_line(summary),
+            out_fd=log_fd,
+            )
+    
+    id_map = {}
+    in_msg_list = read_jobs(
+            ui_lock,
+            log,
+            summary,
+            job_list,
+            id_map,
+            window,
+            not args.no_journal,
+            args.resume,
+            )
+    
+    if args.stats_prom is not None:
+        stats_stop_event = threading.Event()
+        threading.Thread(
+                target=stats_thread,
+                args=(
+                        summary,
+                        args.stats_prom,
+                        args.stats_interval if args.stats_interval is not None
+                                else stats.DEFAULT_PROMETHEUS_INTERVAL,
+                        stats_stop_event,
+                        ),
+                daemon=True,
+                ).start()
+    else:
+        stats_stop_event = None
+    
+    done_event = threading.Event()
+    signal.signal(
+            signal.SIGINT,
+            lambda signum, frame: on_sigint(log, cancel_token, signum, frame),
+            )
+    make_world_news_func(
+            in_msg_list,
+            site_url,
+            news_secret_key,
+            use_short=args.use_short,
+            other_word_func_factory=other_word_func_factory,
+            conc=args.conc,
+            on_begin=lambda err, data: on_begin(err, log, id_map, data),
+            on_result=lambda err, data: on_result(err, ui_lock, log, summary, data),
+            callback=lambda err: on_done(
+                    err, ui_lock, log, job_list, summary, done_event),
+            **engine_kwargs
+            )
+    done_event.wait()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    
+    if stats_stop_event is not None:
+        stats_stop_event.set()
+    
+    if stats_obj is not None:
+        write_stats(summary, args.stats_json, args.stats_prom)
+    
+    log.close()
+    
+    if short_pool is not None:
+        short_pool.close()
+    
+    if short_cache_obj is not None:
+        short_cache_obj.close()
+    
+    # results of cancelled run are not complete: pipeline must not take
+    # them for success
+    if summary.write_failed:
+        sys.exit(1)
+    if cancel_token.cancelled:
+        sys.exit(CANCELLED_EXIT_STATUS)
+    if summary.failed_job_count:
+        sys.exit(1)
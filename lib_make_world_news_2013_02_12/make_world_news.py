@@ -17,14 +17,29 @@
 
 assert str is not bytes
 
-import sys, threading, hashlib, hmac, base64, json
-from urllib import parse as url_parse, request
+import sys, threading, time, hashlib, hmac, collections, traceback
+from . import http_pool, shortener, url_memo, message_transformer, adaptive_limit
+from . import chunk_dispatch, rate_limit
 
 DEFAULT_CONCURRENCY = 20
 
 class Data:
     pass
 
+class ShortMessage:
+    # message, which waits for its short links. each link is separate url
+    # task ``(short_msg, short_i, short_item)``, and may be done by any
+    # worker. the worker, which does the last one, joins the message
+    
+    def __init__(self, data, result_msg, short_pos_list, short_count):
+        self.data = data
+        self.result_msg = result_msg
+        self.short_pos_list = short_pos_list
+        self.micro_news_url_list = [None] * short_count
+        self.left_count = short_count
+        self.err = None
+        self.lock = threading.Lock()
+
 def get_news_key(original_news_url, news_secret_key):
     news_key = hmac.new(
             news_secret_key,
@@ -34,139 +49,263 @@ def get_news_key(original_news_url, news_secret_key):
     
     return news_key[:6]
 
-def make_world_news_thread(thr_lock, in_msg_iter,
-        site_url, news_secret_key, use_short=None, other_word_func_factory=None,
-        on_begin=None, on_result=None):
-    if use_short is None:
-        use_short = False
+def call_handler(handler, err, data):
+    # calls ``on_begin()`` or ``on_result()``. its exception must not stop
+    # worker with other messages of chunk (their ``on_result()`` would be
+    # never called, and reorder window of caller would hang). it is
+    # printed, as uncaught exception of thread
     
-    while True:
-        data = Data()
+    if handler is None:
+        return
+    
+    try:
+        handler(err, data)
+    except Exception:
+        traceback.print_exc()
+
+def split_short_message(transformer, url_task_deque, data, cancel_token=None,
+        on_result=None):
+    # puts url tasks of message to ``url_task_deque``, but the first one is
+    # done at once
+    
+    try:
+        if cancel_token is not None:
+            cancel_token.check()
+        
+        result_msg, short_item_list, short_pos_list = transformer.split(data.in_msg)
+        
+        if not short_item_list:
+            data.result = transformer.join(result_msg)
+    except Exception:
+        call_handler(on_result, sys.exc_info(), data)
+        
+        return
+    
+    if not short_item_list:
+        call_handler(on_result, None, data)
+        
+        return
+    
+    short_msg = ShortMessage(data, result_msg, short_pos_list, len(short_item_list))
+    url_task_deque.extend(
+            (short_msg, short_i, short_item)
+            for short_i, short_item in enumerate(short_item_list)
+            if short_i
+            )
+    run_url_task(
+            transformer,
+            (short_msg, 0, short_item_list[0]),
+            cancel_token=cancel_token,
+            on_result=on_result,
+            )
+
+def run_url_task(transformer, url_task, cancel_token=None, on_result=None):
+    short_msg, short_i, short_item = url_task
+    stats = transformer.stats
+    micro_news_url = None
+    err = None
+    
+    # when message is already failed, its other links are not needed
+    if short_msg.err is None:
+        start_time = time.perf_counter()
         
         try:
-            with thr_lock:
-                try:
-                    data.msg_id, data.in_msg = next(in_msg_iter)
-                except StopIteration:
-                    return
-        except Exception:
-            if on_begin is not None:
-                on_begin(sys.exc_info(), data)
+            if cancel_token is not None:
+                cancel_token.check()
             
-            continue
+            micro_news_url = transformer.short_many((short_item,))[0]
+        except Exception:
+            err = sys.exc_info()
+        finally:
+            if stats is not None:
+                stats.add_time('shortener', time.perf_counter() - start_time)
+    
+    with short_msg.lock:
+        if err is not None:
+            if short_msg.err is None:
+                short_msg.err = err
         else:
-            if on_begin is not None:
-                on_begin(None, data)
+            short_msg.micro_news_url_list[short_i] = micro_news_url
         
+        short_msg.left_count -= 1
+        
+        if short_msg.left_count:
+            return
+    
+    data = short_msg.data
+    err = short_msg.err
+    
+    if err is None:
         try:
-            if other_word_func_factory is not None:
-                other_word_func = other_word_func_factory()
-            result_msg = []
-            
-            for in_msg_cell in data.in_msg.split('|'):
-                result_cell = []
-                
-                for in_msg_word in in_msg_cell.split(' '):
-                    if not in_msg_word.startswith('https://') and \
-                            not in_msg_word.startswith('http://') or \
-                            in_msg_word.startswith(url_parse.urljoin(site_url, 'sh/')) or \
-                            in_msg_word.startswith(url_parse.urljoin(site_url, 'news/')):
-                        if other_word_func_factory is not None:
-                            in_msg_word = other_word_func(in_msg_word)
-                        
-                        result_cell.append(in_msg_word)
-                        
-                        continue
-                    
-                    in_msg_url = in_msg_word
-                    
-                    news_key = get_news_key(in_msg_url, news_secret_key)
-                    news_key_b64 = base64.b64encode(news_key).decode('utf-8', 'replace')
-                    
-                    if use_short:
-                        opener = request.build_opener()
-                        resp = opener.open(
-                                request.Request(
-                                        url_parse.urljoin(site_url, 'api/sh/new'),
-                                        json.dumps({
-                                                'original_news_url': in_msg_url,
-                                                'news_key': news_key_b64,
-                                               }).encode(),
-                                        {'Content-Type': 'application/json;charset=utf-8'},
-                                        ),
-                                timeout=20.0,
-                                )
-                        if resp.getcode() != 200:
-                            raise IOError('resp.getcode() != 200')
-                        
-                        sh_data = json.loads(resp.read(10000000).decode('utf-8', 'replace'))
-                        news_url = sh_data.get('micro_news_url')
-                    else:
-                        o_scheme, o_netloc, o_path, o_query, o_fragment = \
-                                url_parse.urlsplit(in_msg_url)
-                        
-                        o_netloc = o_netloc.replace('.', '_')
-                        
-                        if o_path and not o_path.startswith('/'):
-                            o_path = '/{}'.format(o_path)
-                        
-                        query_kwargs = {
-                                'key': news_key_b64,
-                                }
-                        
-                        if o_scheme and o_scheme != 'http':
-                            query_kwargs['scheme'] = o_scheme
-                        
-                        if o_netloc.startswith('www_'):
-                            query_kwargs['wnetloc'] = o_netloc[len('www_'):]
-                        elif o_netloc:
-                            query_kwargs['netloc'] = o_netloc
-                        
-                        if o_query:
-                            query_kwargs['query'] = o_query
-                        
-                        if o_fragment:
-                            query_kwargs['fragment'] = o_fragment
-                        
-                        query = url_parse.urlencode(query_kwargs)
-                        news_url_path = 'news{}{}'.format(
-                                o_path,
-                                '?{}'.format(query) if query else '',
-                                )
-                        news_url = url_parse.urljoin(site_url, news_url_path)
-                    
-                    result_cell.append(news_url)
-                
-                result_msg.append(' '.join(result_cell))
-            
-            data.result = '|'.join(result_msg)
+            data.result = transformer.join(
+                    short_msg.result_msg,
+                    short_msg.short_pos_list,
+                    short_msg.micro_news_url_list,
+                    )
         except Exception:
-            if on_result is not None:
-                on_result(sys.exc_info(), data)
+            err = sys.exc_info()
+    
+    call_handler(on_result, err, data)
+
+def transform_chunk(transformer, url_task_deque, chunk, cancel_token=None,
+        on_begin=None, on_result=None):
+    data_list = []
+    
+    for msg_id, in_msg in chunk:
+        data = Data()
+        data.msg_id, data.in_msg = msg_id, in_msg
+        data_list.append(data)
+        call_handler(on_begin, None, data)
+    
+    if transformer.use_short:
+        for data in data_list:
+            split_short_message(
+                    transformer,
+                    url_task_deque,
+                    data,
+                    cancel_token=cancel_token,
+                    on_result=on_result,
+                    )
+        
+        return
+    
+    # long links of whole chunk at once
+    result_list = transformer.transform_many([data.in_msg for data in data_list])
+    
+    for data, (result, e) in zip(data_list, result_list):
+        data.result = result
+        
+        if e is not None:
+            call_handler(on_result, (type(e), e, e.__traceback__), data)
+        else:
+            call_handler(on_result, None, data)
+
+def make_world_news_thread(dispatcher, url_task_deque, transformer,
+        cancel_token=None, on_begin=None, on_result=None):
+    # url tasks of messages, which are already begun, go before new messages.
+    # a worker takes new messages only when ``url_task_deque`` is empty, so
+    # url tasks are not left, while all workers wait for input.
+    #
+    # after cancel, url tasks are failed without requests, and new messages
+    # are not taken
+    
+    done_count = None
+    done_seconds = None
+    
+    while True:
+        try:
+            url_task = url_task_deque.popleft()
+        except IndexError:
+            pass
+        else:
+            run_url_task(
+                    transformer,
+                    url_task,
+                    cancel_token=cancel_token,
+                    on_result=on_result,
+                    )
             
             continue
+        
+        if cancel_token is not None and cancel_token.cancelled:
+            return
+        
+        chunk, err = dispatcher.take(done_count, done_seconds)
+        
+        if chunk:
+            start_time = time.thread_time()
+            transform_chunk(
+                    transformer,
+                    url_task_deque,
+                    chunk,
+                    cancel_token=cancel_token,
+                    on_begin=on_begin,
+                    on_result=on_result,
+                    )
+            done_count = len(chunk)
+            done_seconds = time.thread_time() - start_time
         else:
-            if on_result is not None:
-                on_result(None, data)
+            done_count = None
+            done_seconds = None
+        
+        if err is not None:
+            call_handler(on_begin, err, Data())
+        elif not chunk:
+            return
 
 def make_world_news(in_msg_list,
         site_url, news_secret_key, use_short=None, other_word_func_factory=None,
-        conc=None, on_begin=None, on_result=None, callback=None):
+        short_func=None, memo=None, conc=None, limiter=None, bucket=None,
+        stats=None, max_chunk_size=None, cancel_token=None,
+        on_begin=None, on_result=None, callback=None):
+    # workers take messages by chunks of up to ``max_chunk_size``
+    # (``chunk_dispatch.ChunkDispatcher``). with short links, by one, and
+    # links of message are shortened in parallel by all workers (each link
+    # is separate url task, see ``ShortMessage``).
+    #
+    # with ``cancel_token`` (``cancel.CancelToken``), the run may be stopped:
+    # messages, which are begun, get ``on_result()`` with error (in flight
+    # requests of own pool are aborted), and other ones are not read
+    #
+    # with ``limiter`` (``adaptive_limit.AimdLimiter``), there are
+    # ``limiter.max_limit`` threads, but only ``limiter.limit`` of them may
+    # wait for short link server at once
+    #
+    # with ``bucket`` (``rate_limit.TokenBucket``), requests of own pool are
+    # not sent faster than ``bucket.rate``, whatever count of threads
+    
     if conc is None:
         conc = DEFAULT_CONCURRENCY
+    if memo is None:
+        memo = url_memo.UrlMemo()
+    if limiter is not None:
+        conc = limiter.max_limit
+    
+    if use_short:
+        max_chunk_size = 1
+    
+    if use_short and short_func is None:
+        short_pool = http_pool.HttpPool(size=conc)
+        request_pool = short_pool
+        
+        if bucket is not None:
+            request_pool = rate_limit.RateLimitedPool(request_pool, bucket, stats=stats)
+        
+        if limiter is not None:
+            request_pool = adaptive_limit.LimitedPool(request_pool, limiter)
+        
+        short_func = shortener.Shortener(site_url, pool=request_pool)
+    else:
+        short_pool = None
+    
+    if short_pool is not None and cancel_token is not None:
+        cancel_token.add_callback(short_pool.abort)
+    
+    transformer = message_transformer.MessageTransformer(
+            site_url,
+            news_secret_key,
+            use_short=use_short,
+            other_word_func_factory=other_word_func_factory,
+            short_func=short_func,
+            memo=memo,
+            stats=stats,
+            )
     
-    thr_lock = threading.RLock()
-    in_msg_iter = enumerate(in_msg_list)
+    dispatcher = chunk_dispatch.ChunkDispatcher(
+            enumerate(in_msg_list),
+            max_chunk_size=max_chunk_size,
+            stats=stats,
+            )
+    # ``deque`` appends and pops are threadsafe
+    url_task_deque = collections.deque()
     
     thread_list = tuple(
             threading.Thread(
                     target=lambda: make_world_news_thread(
-                            thr_lock,
-                            in_msg_iter,
-                            site_url,
-                            news_secret_key,
-                            use_short=use_short,
-                            other_word_func_factory=other_word_func_factory,
+                            dispatcher,
+                            url_task_deque,
+                            transformer,
+                            cancel_token=cancel_token,
                             on_begin=on_begin,
                             on_result=on_result,
                             ),
@@ -181,6 +320,12 @@ def make_world_news(in_msg_list,
         for thread in thread_list:
             thread.join()
         
+        if short_pool is not None:
+            if cancel_token is not None:
+                cancel_token.remove_callback(short_pool.abort)
+            
+            short_pool.close()
+        
         if callback is not None:
             callback(None)
     
@@ -0,0 +1,385 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import time, hashlib, binascii
+from urllib import parse as url_parse
+from . import shortener
+
+URL_PREFIXES = ('https://', 'http://')
+NEWS_KEY_SIZE = 6 # bytes
+
+def get_hmac_states(news_secret_key):
+    # returns inner and outer SHA-256 states of HMAC (RFC 2104), with key
+    # already absorbed. HMAC of message is
+    # ``outer.copy().update(inner.copy().update(msg).digest()).digest()``
+    
+    block_size = hashlib.sha256().block_size
+    
+    if len(news_secret_key) > block_size:
+        news_secret_key = hashlib.sha256(news_secret_key).digest()
+    
+    block_key = news_secret_key.ljust(block_size, b'\0')
+    
+    return (
+            hashlib.sha256(bytes(b ^ 0x36 for b in block_key)),
+            hashlib.sha256(bytes(b ^ 0x5c for b in block_key)),
+            )
+
+class MessageTransformer:
+    # everything, what does not change during run (url prefixes of site,
+    # keyed HMAC state, ...), is prepared once here. ``transform()`` is
+    # threadsafe, and may be used by any engine.
+    #
+    # with ``stats`` (``stats.Stats``), time of stages ``hashtags``,
+    # ``links`` and ``shortener`` and count of ``urls`` are collected
+    
+    def __init__(self, site_url, news_secret_key, use_short=None,
+            other_word_func_factory=None, short_func=None, memo=None, stats=None):
+        if use_short is None:
+            use_short = False
+        
+        assert not use_short or short_func is not None
+        
+        self.site_url = site_url
+        self.use_short = use_short
+        self.other_word_func_factory = other_word_func_factory
+        self.short_func = short_func
+        self.memo = memo
+        self.stats = stats
+        
+        self._site_prefixes = (
+                url_parse.urljoin(site_url, 'sh/'),
+                url_parse.urljoin(site_url, 'news/'),
+                )
+        self._news_base_url = url_parse.urljoin(site_url, 'news')
+        self._hmac_inner, self._hmac_outer = get_hmac_states(news_secret_key)
+    
+    def get_news_key(self, original_news_url):
+        inner = self._hmac_inner.copy()
+        inner.update(original_news_url.encode())
+        outer = self._hmac_outer.copy()
+        outer.update(inner.digest())
+        
+        return outer.digest()[:NEWS_KEY_SIZE]
+    
+    def get_news_keys(self, original_news_url_list):
+        # returns list of ``(news_key, news_key_b64)``
+        
+        inner_copy = self._hmac_inner.copy
+        outer_copy = self._hmac_outer.copy
+        b2a_base64 = binascii.b2a_base64
+        result = []
+        
+        for original_news_url in original_news_url_list:
+            inner = inner_copy()
+            inner.update(original_news_url.encode())
+            outer = outer_copy()
+            outer.update(inner.digest())
+            news_key = outer.digest()[:NEWS_KEY_SIZE]
+            result.append((news_key, b2a_base64(news_key, newline=False).decode()))
+        
+        return result
+    
+    def get_long_news_url(self, original_news_url, news_key_b64):
+        o_scheme, o_netloc, o_path, o_query, o_fragment = \
+                url_parse.urlsplit(original_news_url)
+        
+        o_netloc = o_netloc.replace('.', '_')
+        
+        if o_path and not o_path.startswith('/'):
+            o_path = '/{}'.format(o_path)
+        
+        query_kwargs = {
+                'key': news_key_b64,
+                }
+        
+        if o_scheme and o_scheme != 'http':
+            query_kwargs['scheme'] = o_scheme
+        
+        if o_netloc.startswith('www_'):
+            query_kwargs['wnetloc'] = o_netloc[len('www_'):]
+        elif o_netloc:
+            query_kwargs['netloc'] = o_netloc
+        
+        if o_query:
+            query_kwargs['query'] = o_query
+        
+        if o_fragment:
+            query_kwargs['fragment'] = o_fragment
+        
+        query = url_parse.urlencode(query_kwargs)
+        
+        if '//' not in o_path and '/.' not in o_path:
+            # nothing to normalize. ``urljoin()`` would give the same
+            return '{}{}?{}'.format(self._news_base_url, o_path, query)
+        
+        news_url_path = 'news{}?{}'.format(o_path, query)
+        
+        return url_parse.urljoin(self.site_url, news_url_path)
+    
+    def _scan(self, in_msg):
+        # first pass. returns ``(result_msg, url_list, url_pos_list,
+        # url_count, hashtags_seconds)``: places of urls, which are not in
+        # memo, are ``None`` in ``result_msg``. time is measured only with
+        # ``stats``
+        
+        if self.other_word_func_factory is not None:
+            other_word_func = self.other_word_func_factory()
+        else:
+            other_word_func = None
+        
+        # whole cell at once, if ``other_word_func`` can do it
+        replace_cell = getattr(other_word_func, 'replace_cell', None)
+        
+        if replace_cell is not None:
+            other_word_func = None
+        
+        memo = self.memo
+        timing = self.stats is not None
+        perf_counter = time.perf_counter
+        hashtags_seconds = 0.0
+        url_count = 0
+        site_prefixes = self._site_prefixes
+        result_msg = []
+        url_list = []
+        url_pos_list = []
+        
+        for in_msg_cell in in_msg.split('|'):
+            if replace_cell is not None:
+                if timing:
+                    start_time = perf_counter()
+                    in_msg_cell = replace_cell(in_msg_cell)
+                    hashtags_seconds += perf_counter() - start_time
+                else:
+                    in_msg_cell = replace_cell(in_msg_cell)
+            
+            result_cell = []
+            
+            for in_msg_word in in_msg_cell.split(' '):
+                if not in_msg_word.startswith(URL_PREFIXES) or \
+                        in_msg_word.startswith(site_prefixes):
+                    if other_word_func is not None:
+                        if timing:
+                            start_time = perf_counter()
+                            in_msg_word = other_word_func(in_msg_word)
+                            hashtags_seconds += perf_counter() - start_time
+                        else:
+                            in_msg_word = other_word_func(in_msg_word)
+                    
+                    result_cell.append(in_msg_word)
+                    
+                    continue
+                
+                url_count += 1
+                
+                if memo is not None:
+                    news_url = memo.get(in_msg_word)
+                    
+                    if news_url is not None:
+                        result_cell.append(news_url)
+                        
+                        continue
+                
+                url_list.append(in_msg_word)
+                url_pos_list.append((len(result_msg), len(result_cell)))
+                result_cell.append(None)
+            
+            result_msg.append(result_cell)
+        
+        return result_msg, url_list, url_pos_list, url_count, hashtags_seconds
+    
+    def _fill(self, result_msg, url_list, url_pos_list, key_list):
+        # second pass. in long mode, puts long urls to their places.
+        # returns ``(short_item_list, short_pos_list)``
+        
+        if self.use_short:
+            return [
+                    (original_news_url, news_key_b64)
+                    for original_news_url, (news_key, news_key_b64)
+                    in zip(url_list, key_list)
+                    ], url_pos_list
+        
+        memo = self.memo
+        
+        for original_news_url, url_pos, (news_key, news_key_b64) in \
+                zip(url_list, url_pos_list, key_list):
+            news_url = self.get_long_news_url(original_news_url, news_key_b64)
+            
+            if memo is not None:
+                memo.put(original_news_url, news_url)
+            
+            cell_i, word_i = url_pos
+            result_msg[cell_i][word_i] = news_url
+        
+        return [], []
+    
+    def split(self, in_msg):
+        # returns ``(result_msg, short_item_list, short_pos_list)``.
+        #
+        # ``result_msg`` is list of cells (lists of words). in short mode,
+        # places of urls are ``None`` and must be filled by ``join()`` with
+        # results of shortening of ``short_item_list``
+        
+        result_msg, url_list, url_pos_list, url_count, hashtags_seconds = \
+                self._scan(in_msg)
+        
+        start_time = time.perf_counter()
+        
+        short_item_list, short_pos_list = self._fill(
+                result_msg, url_list, url_pos_list, self.get_news_keys(url_list))
+        
+        if self.stats is not None:
+            self.stats.count_many((
+                    ('stage_seconds', hashtags_seconds, ('stage', 'hashtags')),
+                    ('stage_seconds', time.perf_counter() - start_time, ('stage', 'links')),
+                    ('urls', url_count, None),
+                    ))
+        
+        return result_msg, short_item_list, short_pos_list
+    
+    def join(self, result_msg, short_pos_list=None, micro_news_url_list=None):
+        if short_pos_list:
+            for short_pos, micro_news_url in zip(short_pos_list, micro_news_url_list):
+                cell_i, word_i = short_pos
+                result_msg[cell_i][word_i] = micro_news_url
+        
+        return '|'.join(' '.join(result_cell) for result_cell in result_msg)
+    
+    def short_many(self, short_item_list):
+        if self.memo is not None:
+            return self.memo.short_many(self.short_func, short_item_list)
+        
+        return shortener.short_many(self.short_func, short_item_list)
+    
+    async def async_short_many(self, short_item_list):
+        if self.memo is not None:
+            return await self.memo.async_short_many(self.short_func, short_item_list)
+        
+        return await self.short_func.short_many(short_item_list)
+    
+    # threadsafe function
+    def transform_many(self, in_msg_list):
+        # returns list of ``(result, e)``, where ``e`` is exception of failed
+        # message (or ``None``). in long mode, news keys of whole list are
+        # made by one ``get_news_keys()``
+        
+        if self.use_short:
+            result_list = []
+            
+            for in_msg in in_msg_list:
+                try:
+                    result_list.append((self.transform(in_msg), None))
+                except Exception as e:
+                    result_list.append((None, e))
+            
+            return result_list
+        
+        scan_list = []
+        url_list = []
+        url_count = 0
+        hashtags_seconds = 0.0
+        
+        for in_msg in in_msg_list:
+            try:
+                scan = self._scan(in_msg)
+            except Exception as e:
+                scan = e
+            else:
+                url_list.extend(scan[1])
+                url_count += scan[3]
+                hashtags_seconds += scan[4]
+            
+            scan_list.append(scan)
+        
+        start_time = time.perf_counter()
+        
+        try:
+            key_list = self.get_news_keys(url_list)
+        except Exception:
+            # some url is bad. keys are made again per message, so that only
+            # its message fails
+            key_list = None
+        
+        key_i = 0
+        result_list = []
+        
+        for scan in scan_list:
+            if isinstance(scan, Exception):
+                result_list.append((None, scan))
+                
+                continue
+            
+            result_msg, msg_url_list, url_pos_list = scan[:3]
+            
+            try:
+                if key_list is not None:
+                    msg_key_list = key_list[key_i:key_i + len(msg_url_list)]
+                    key_i += len(msg_url_list)
+                else:
+                    msg_key_list = self.get_news_keys(msg_url_list)
+                
+                self._fill(result_msg, msg_url_list, url_pos_list, msg_key_list)
+            except Exception as e:
+                result_list.append((None, e))
+            else:
+                result_list.append((self.join(result_msg), None))
+        
+        if self.stats is not None:
+            self.stats.count_many((
+                    ('stage_seconds', hashtags_seconds, ('stage', 'hashtags')),
+                    ('stage_seconds', time.perf_counter() - start_time, ('stage', 'links')),
+                    ('urls', url_count, None),
+                    ))
+        
+        return result_list
+    
+    # threadsafe function
+    def transform(self, in_msg):
+        result_msg, short_item_list, short_pos_list = self.split(in_msg)
+        
+        if short_item_list:
+            start_time = time.perf_counter()
+            
+            try:
+                micro_news_url_list = self.short_many(short_item_list)
+            finally:
+                if self.stats is not None:
+                    self.stats.add_time('shortener', time.perf_counter() - start_time)
+        else:
+            micro_news_url_list = None
+        
+        return self.join(result_msg, short_pos_list, micro_news_url_list)
+    
+    async def async_transform(self, in_msg):
+        # for asyncio engine. ``short_func`` must be asyncio variant
+        
+        result_msg, short_item_list, short_pos_list = self.split(in_msg)
+        
+        if short_item_list:
+            start_time = time.perf_counter()
+            
+            try:
+                micro_news_url_list = await self.async_short_many(short_item_list)
+            finally:
+                if self.stats is not None:
+                    self.stats.add_time('shortener', time.perf_counter() - start_time)
+        else:
+            micro_news_url_list = None
+        
+        return self.join(result_msg, short_pos_list, micro_news_url_list)
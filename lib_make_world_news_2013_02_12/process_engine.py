@@ -0,0 +1,151 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import sys, os, threading, signal
+from concurrent import futures
+from . import url_memo, message_transformer
+from .make_world_news import Data
+
+DEFAULT_CHUNK_SIZE = 100
+CHUNKS_PER_WORKER = 2
+
+# transformer of worker process. is created once by ``init_worker()``
+_transformer = None
+
+def get_default_concurrency():
+    return os.cpu_count() or 1
+
+def init_worker(site_url, news_secret_key, other_word_func_factory):
+    global _transformer
+    
+    # ^C of terminal goes to whole process group. it is for main process:
+    # it cancels run
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    _transformer = message_transformer.MessageTransformer(
+            site_url,
+            news_secret_key,
+            other_word_func_factory=other_word_func_factory,
+            memo=url_memo.UrlMemo(),
+            )
+
+def transform_chunk(chunk):
+    # returns list of ``(result, err)``. ``err`` is ``(type, value, None)``,
+    # since traceback can not be passed from worker process
+    
+    return [
+            (result, None) if e is None else (None, (type(e), e, None))
+            for result, e in _transformer.transform_many(chunk)
+            ]
+
+def make_world_news_processes(in_msg_list,
+        site_url, news_secret_key, use_short=None, other_word_func_factory=None,
+        conc=None, chunk_size=None, cancel_token=None,
+        on_begin=None, on_result=None, callback=None):
+    # the same contract as ``make_world_news.make_world_news()``, but chunks
+    # of messages are processed by pool of ``conc`` worker processes (one per
+    # core, by default). only for long links: this work is pure CPU.
+    #
+    # ``other_word_func_factory`` must be picklable (as one from
+    # ``hashtag_replacer.create_word_func_factory()``).
+    #
+    # after cancel of ``cancel_token``, chunks in flight are finished (it is
+    # about milliseconds), and new ones are not read
+    
+    if use_short:
+        raise ValueError('processes engine does not support short links')
+    if conc is None:
+        conc = get_default_concurrency()
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    
+    chunk_sem = threading.BoundedSemaphore(conc * CHUNKS_PER_WORKER)
+    
+    def on_chunk_done(chunk_data_list, future):
+        try:
+            try:
+                result_list = future.result()
+            except Exception:
+                err = sys.exc_info()
+                result_list = [(None, err)] * len(chunk_data_list)
+            
+            for data, result_item in zip(chunk_data_list, result_list):
+                data.result, err = result_item
+                
+                if on_result is not None:
+                    on_result(err, data)
+        finally:
+            chunk_sem.release()
+    
+    def in_thread():
+        in_msg_iter = enumerate(in_msg_list)
+        in_msg_end = False
+        
+        try:
+            with futures.ProcessPoolExecutor(
+                    max_workers=conc,
+                    initializer=init_worker,
+                    initargs=(site_url, news_secret_key, other_word_func_factory),
+                    ) as executor:
+                while not in_msg_end:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        break
+                    
+                    chunk_data_list = []
+                    
+                    while len(chunk_data_list) < chunk_size:
+                        data = Data()
+                        
+                        try:
+                            data.msg_id, data.in_msg = next(in_msg_iter)
+                        except StopIteration:
+                            in_msg_end = True
+                            break
+                        except Exception:
+                            if on_begin is not None:
+                                on_begin(sys.exc_info(), data)
+                            
+                            continue
+                        
+                        if on_begin is not None:
+                            on_begin(None, data)
+                        
+                        chunk_data_list.append(data)
+                    
+                    if not chunk_data_list:
+                        continue
+                    
+                    chunk_sem.acquire()
+                    
+                    future = executor.submit(
+                            transform_chunk,
+                            [data.in_msg for data in chunk_data_list],
+                            )
+                    future.add_done_callback(
+                            lambda future, chunk_data_list=chunk_data_list:
+                                    on_chunk_done(chunk_data_list, future),
+                            )
+        except Exception:
+            if callback is not None:
+                callback(sys.exc_info())
+        else:
+            if callback is not None:
+                callback(None)
+    
+    threading.Thread(target=in_thread).start()
@@ -0,0 +1,121 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import sys, threading, time, queue
+
+VERBOSITY_LIST = ('messages', 'progress', 'errors')
+DEFAULT_VERBOSITY = 'progress'
+DEFAULT_INTERVAL = 1.0 # seconds
+
+_CLOSE = object()
+
+class ProgressLog:
+    # lines are put to queue, and are written by one writer thread, so
+    # workers never wait for terminal (or pipe). verbosity:
+    #
+    # ``messages`` -- line per message;
+    # ``progress`` -- line ``status_func()`` once per ``interval``;
+    # ``errors`` -- errors only.
+    #
+    # errors and ``info()`` lines are written with any verbosity
+    
+    def __init__(self, verbosity=None, status_func=None, interval=None, out_fd=None):
+        if verbosity is None:
+            verbosity = DEFAULT_VERBOSITY
+        if interval is None:
+            interval = DEFAULT_INTERVAL
+        if out_fd is None:
+            out_fd = sys.stdout
+        
+        assert verbosity in VERBOSITY_LIST
+        assert verbosity != 'progress' or status_func is not None
+        
+        self.verbosity = verbosity
+        self._status_func = status_func
+        self._interval = interval
+        self._out_fd = out_fd
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_thread, daemon=True)
+        self._thread.start()
+    
+    @property
+    def per_message(self):
+        return self.verbosity == 'messages'
+    
+    # threadsafe function
+    def message(self, line):
+        if self.verbosity == 'messages':
+            self._queue.put(line)
+    
+    # threadsafe function
+    def error(self, line):
+        self._queue.put(line)
+    
+    # threadsafe function
+    def info(self, line):
+        self._queue.put(line)
+    
+    def _write_thread(self):
+        periodic = self.verbosity == 'progress'
+        broken = False
+        next_time = time.monotonic() + self._interval
+        
+        while True:
+            if periodic:
+                timeout = max(next_time - time.monotonic(), 0.0)
+            else:
+                timeout = None
+            
+            try:
+                line_list = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                line_list = []
+            
+            # everything else, what is ready, by one write
+            while line_list:
+                try:
+                    line_list.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            closed = _CLOSE in line_list
+            
+            if closed:
+                line_list = line_list[:line_list.index(_CLOSE)]
+            
+            if periodic and not closed and time.monotonic() >= next_time:
+                line_list.append(self._status_func())
+                next_time = time.monotonic() + self._interval
+            
+            if line_list and not broken:
+                try:
+                    self._out_fd.write(''.join('{}\n'.format(line) for line in line_list))
+                    self._out_fd.flush()
+                except OSError:
+                    # for example, reader of pipe is gone. the run goes on
+                    broken = True
+            
+            if closed:
+                return
+    
+    def close(self):
+        # writes everything that is left
+        
+        self._queue.put(_CLOSE)
+        self._thread.join()
@@ -0,0 +1,142 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, asyncio, time
+from . import http_pool
+
+DEFAULT_BURST = 1
+
+class TokenBucket:
+    # limit of request rate: ``rate`` requests per second on average, and
+    # not more than ``burst`` of them at once (after idle time).
+    #
+    # each request takes a token. if there is no one, the request reserves
+    # the next one (count of tokens goes below zero), and waits for its time
+    # without lock. so waiting requests are sent in order of reservation,
+    # exactly at ``rate``, whatever count of workers waits.
+    #
+    # ``acquire()`` is for threads, ``async_acquire()`` is for event loop.
+    # both return seconds of waiting
+    
+    def __init__(self, rate, burst=None):
+        if burst is None:
+            burst = DEFAULT_BURST
+        
+        assert rate > 0 and burst >= 1
+        
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._abort_event = threading.Event()
+        self._tokens = float(burst)
+        self._update_time = time.monotonic()
+        self.request_count = 0
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+    
+    def _reserve(self):
+        # returns seconds to wait for reserved token
+        
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                    self._tokens + (now - self._update_time) * self.rate,
+                    float(self.burst),
+                    )
+            self._update_time = now
+            self._tokens -= 1.0
+            self.request_count += 1
+            
+            if self._tokens >= 0.0:
+                return 0.0
+            
+            wait = -self._tokens / self.rate
+            self.wait_count += 1
+            self.wait_seconds += wait
+            
+            return wait
+    
+    # threadsafe function
+    def acquire(self):
+        if self._abort_event.is_set():
+            raise http_pool.Aborted('requests are aborted')
+        
+        wait = self._reserve()
+        
+        if wait and self._abort_event.wait(wait):
+            raise http_pool.Aborted('requests are aborted')
+        
+        return wait
+    
+    async def async_acquire(self):
+        wait = self._reserve()
+        
+        if wait:
+            await asyncio.sleep(wait)
+        
+        return wait
+    
+    # threadsafe function
+    def abort(self):
+        # waiting and next ``acquire()`` raise ``http_pool.Aborted`` (for
+        # cancel of run)
+        
+        self._abort_event.set()
+
+class RateLimitedPool:
+    # wraps ``http_pool.HttpPool``. each request waits for token of
+    # ``bucket``. seconds of waiting are observed by ``stats`` (histogram
+    # ``short_rate_wait_seconds``), if it is given
+    
+    def __init__(self, pool, bucket, stats=None):
+        self._pool = pool
+        self._bucket = bucket
+        self._stats = stats
+    
+    # threadsafe function
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        wait = self._bucket.acquire()
+        
+        if self._stats is not None:
+            self._stats.observe('short_rate_wait_seconds', wait)
+        
+        return self._pool.request(method, url, body=body, headers=headers, timeout=timeout)
+    
+    def close(self):
+        self._pool.close()
+
+class AsyncRateLimitedPool:
+    # asyncio variant of ``RateLimitedPool``, wraps ``aio_http.AioHttpPool``
+    
+    def __init__(self, pool, bucket, stats=None):
+        self._pool = pool
+        self._bucket = bucket
+        self._stats = stats
+    
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        wait = await self._bucket.async_acquire()
+        
+        if self._stats is not None:
+            self._stats.observe('short_rate_wait_seconds', wait)
+        
+        return await self._pool.request(
+                method, url, body=body, headers=headers, timeout=timeout)
+    
+    async def close(self):
+        await self._pool.close()
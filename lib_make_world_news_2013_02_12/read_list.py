@@ -17,11 +17,22 @@
 
 assert str is not bytes
 
+import sys
+
+# path of standard input (or output)
+STD_PATH = '-'
+
+def open_list(path):
+    if path == STD_PATH:
+        return open(sys.stdin.fileno(), encoding='utf-8', errors='replace', closefd=False)
+    
+    return open(path, encoding='utf-8', errors='replace')
+
 def read_list(path, read_words=None):
     if read_words is None:
         read_words = False
     
-    with open(path, encoding='utf-8', errors='replace') as fd:
+    with open_list(path) as fd:
         for line in filter(None, map(lambda s: s.strip(), fd)):
             if read_words:
                 for word in line.split():
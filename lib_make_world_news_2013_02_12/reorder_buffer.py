@@ -0,0 +1,131 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading
+
+DEFAULT_WINDOW = 1000
+
+SKIP = object()
+
+# bounded reorder buffer: results are put in any order by ``msg_id``
+# (``0, 1, 2, ...``), and are passed to ``write_func`` in order, as soon as
+# every lower ``msg_id`` has been put.
+#
+# ``throttle()`` wraps an input list and stops pulling from it while
+# ``window`` messages are in flight, so memory does not depend on input size
+class ReorderBuffer:
+    def __init__(self, write_func, window=None):
+        if window is None:
+            window = DEFAULT_WINDOW
+        
+        assert callable(write_func)
+        assert window > 0
+        
+        self._write_func = write_func
+        self._window = window
+        self._cond = threading.Condition()
+        self._next_id = 0
+        self._pending = {}
+        self._written = 0
+    
+    @property
+    def written(self):
+        return self._written
+    
+    # threadsafe function
+    def wait(self, msg_id):
+        with self._cond:
+            while msg_id - self._next_id >= self._window:
+                self._cond.wait()
+    
+    def _write(self, result, err):
+        # returns the first error of writing. after error of ``write_func``,
+        # the rest is written anyway: state of buffer is the same, as if
+        # it was ok, and waiters of window are not left
+        
+        if result is SKIP:
+            return err
+        
+        try:
+            self._write_func(result)
+        except Exception as e:
+            return err if err is not None else e
+        
+        self._written += 1
+        
+        return err
+    
+    # threadsafe function
+    def put(self, msg_id, result):
+        # ``result is None`` -- message is failed, nothing to write
+        
+        if result is None:
+            result = SKIP
+        
+        with self._cond:
+            assert msg_id >= self._next_id
+            
+            self._pending[msg_id] = result
+            
+            if msg_id != self._next_id:
+                return
+            
+            err = None
+            
+            while True:
+                try:
+                    result = self._pending.pop(self._next_id)
+                except KeyError:
+                    break
+                
+                self._next_id += 1
+                err = self._write(result, err)
+            
+            self._cond.notify_all()
+            
+            if err is not None:
+                raise err
+    
+    # threadsafe function
+    def finish(self):
+        # writes everything that is left, in order, skipping gaps.
+        # returns count of gaps
+        
+        with self._cond:
+            gap_count = 0
+            err = None
+            
+            for msg_id in sorted(self._pending):
+                gap_count += msg_id - self._next_id
+                result = self._pending.pop(msg_id)
+                self._next_id = msg_id + 1
+                err = self._write(result, err)
+            
+            self._cond.notify_all()
+            
+            if err is not None:
+                raise err
+            
+            return gap_count
+    
+    def throttle(self, in_msg_list):
+        for msg_id, in_msg in enumerate(in_msg_list):
+            self.wait(msg_id)
+            
+            yield in_msg
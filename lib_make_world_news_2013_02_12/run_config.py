@@ -0,0 +1,169 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+# reading of configuration file and creating of objects, which depend on
+# it. is shared by ``main_cli`` and ``service``
+
+import configparser, os.path, base64
+from . import fix_url, read_list, hashtag_replacer, make_world_news, async_engine
+from . import http_pool, aio_http, shortener, short_cache, adaptive_limit, stats
+from . import rate_limit
+
+def read_config(cfg_path):
+    # returns ``(cfg, site_url, news_secret_key, other_word_func_factory)``
+    
+    cfg = configparser.ConfigParser(
+            interpolation=configparser.ExtendedInterpolation())
+    with open(cfg_path, encoding='utf-8', errors='replace') as cfg_fd:
+        cfg.read_file(cfg_fd)
+    
+    site_url = cfg.get('core', 'site_url')
+    site_url = fix_url.fix_url(site_url)
+    
+    news_secret_key_b64 = cfg.get('core', 'news_secret_key')
+    news_secret_key = base64.b64decode(news_secret_key_b64.encode())
+    
+    if cfg.has_option('core', 'hashtag_list'):
+        hashtag_list_path = os.path.join(
+                os.path.dirname(cfg_path),
+                cfg.get('core', 'hashtag_list'),
+                )
+        other_word_func_factory = hashtag_replacer.create_word_func_factory(
+                read_list.read_list(hashtag_list_path, read_words=True),
+                )
+    else:
+        other_word_func_factory = None
+    
+    return cfg, site_url, news_secret_key, other_word_func_factory
+
+def create_limiter(cfg, engine, conc, max_conc):
+    if conc is not None:
+        initial_conc = conc
+    elif engine == 'asyncio':
+        initial_conc = async_engine.DEFAULT_CONCURRENCY
+    else:
+        initial_conc = make_world_news.DEFAULT_CONCURRENCY
+    
+    if max_conc is not None:
+        initial_conc = min(initial_conc, max_conc)
+    
+    return adaptive_limit.AimdLimiter(
+            initial_conc,
+            max_limit=max_conc,
+            latency_target=cfg.getfloat('core', 'short_latency_target', fallback=None),
+            )
+
+def create_rate_limit(cfg):
+    # returns ``None``, if there is no ``short_rate`` in configuration
+    
+    short_rate = cfg.getfloat('core', 'short_rate', fallback=None)
+    
+    if short_rate is None:
+        return None
+    
+    return rate_limit.TokenBucket(
+            short_rate,
+            burst=cfg.getint('core', 'short_burst', fallback=None),
+            )
+
+def create_short_func(cfg, site_url, engine, conc, limiter=None, bucket=None,
+        stats_obj=None):
+    # wrappers of pool, from outer: ``limiter`` (its slot is taken before
+    # waiting for token, so tokens are not taken by requests, which then
+    # wait for slot), ``bucket``, stats (latency without waiting)
+    
+    pool_size = cfg.getint('core', 'pool_size', fallback=None)
+    pool_idle_timeout = cfg.getfloat('core', 'pool_idle_timeout', fallback=None)
+    
+    if limiter is not None:
+        conc = limiter.max_limit
+        
+        if pool_size is None:
+            pool_size = conc
+    
+    if engine == 'asyncio':
+        # connections will be closed by engine, at the end of run
+        
+        if conc is None:
+            conc = async_engine.DEFAULT_CONCURRENCY
+        
+        aio_pool = aio_http.AioHttpPool(
+                size=pool_size if pool_size is not None else conc,
+                idle_timeout=pool_idle_timeout,
+                )
+        
+        if stats_obj is not None:
+            aio_pool = stats.AsyncTimedPool(aio_pool, stats_obj)
+        
+        if bucket is not None:
+            aio_pool = rate_limit.AsyncRateLimitedPool(aio_pool, bucket, stats=stats_obj)
+        
+        if limiter is not None:
+            aio_pool = adaptive_limit.AsyncLimitedPool(aio_pool, limiter)
+        
+        short_func = shortener.AsyncShortener(site_url, pool=aio_pool, conc=conc)
+        
+        return short_func, None
+    
+    short_pool = http_pool.HttpPool(
+            size=pool_size,
+            idle_timeout=pool_idle_timeout,
+            )
+    
+    request_pool = short_pool
+    
+    if stats_obj is not None:
+        request_pool = stats.TimedPool(request_pool, stats_obj)
+    
+    if bucket is not None:
+        request_pool = rate_limit.RateLimitedPool(request_pool, bucket, stats=stats_obj)
+    
+    if limiter is not None:
+        request_pool = adaptive_limit.LimitedPool(request_pool, limiter)
+    
+    short_batch_size = cfg.getint('core', 'short_batch_size', fallback=None)
+    
+    if short_batch_size is not None and short_batch_size > 1:
+        short_func = shortener.BatchShortener(
+                site_url,
+                pool=request_pool,
+                batch_size=short_batch_size,
+                batch_delay=cfg.getfloat('core', 'short_batch_delay', fallback=None),
+                )
+    else:
+        short_func = shortener.Shortener(site_url, pool=request_pool)
+    
+    return short_func, short_pool
+
+def create_short_cache(cfg, cfg_path):
+    # returns ``None``, if there is no ``short_cache`` in configuration
+    
+    if not cfg.has_option('core', 'short_cache'):
+        return None
+    
+    short_cache_path = os.path.join(
+            os.path.dirname(cfg_path),
+            cfg.get('core', 'short_cache'),
+            )
+    
+    return short_cache.ShortCache(
+            short_cache_path,
+            max_size=cfg.getint('core', 'short_cache_max_size', fallback=None),
+            max_age=cfg.getfloat('core', 'short_cache_max_age', fallback=None),
+            )
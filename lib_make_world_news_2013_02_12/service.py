@@ -0,0 +1,331 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# long-running local HTTP service: configuration, hashtag list, workers,
+# connections to shortener and url memo are made once, and are used by all
+# requests.
+#
+#   POST /transform  {"message": "..."} -> {"result": "..."}
+#                    {"messages": ["...", ...]} -> {"results": [{"result": "..."}, ...]}
+#   GET /health      {"status": "ok"}
+#   GET /stats       metrics (JSON)
+#   GET /metrics     metrics (Prometheus text format)
+#
+# failed message gives ``{"error": "..."}`` instead of ``{"result": "..."}``
+
+assert str is not bytes
+
+import os, argparse, socketserver, json
+from concurrent import futures
+from http import server as http_server
+from urllib import parse as url_parse
+from . import make_world_news, message_transformer, url_memo, short_cache
+from . import adaptive_limit, stats, run_config
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8780
+REQUEST_QUEUE_SIZE = 1024
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+class ServiceRequestHandler(http_server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_json(self, status, obj):
+        self._send(
+                status,
+                'application/json;charset=utf-8',
+                json.dumps(obj, ensure_ascii=False).encode(),
+                )
+    
+    def do_GET(self):
+        service = self.server.service
+        path = url_parse.urlsplit(self.path).path
+        
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+            return
+        
+        if path == '/stats':
+            self._send_json(200, service.get_stats())
+            return
+        
+        if path == '/metrics':
+            self._send(
+                    200,
+                    'text/plain; version=0.0.4;charset=utf-8',
+                    service.get_prometheus().encode(),
+                    )
+            return
+        
+        self._send_json(404, {'error': 'not found'})
+    
+    def do_POST(self):
+        service = self.server.service
+        path = url_parse.urlsplit(self.path).path
+        content_length = int(self.headers.get('Content-Length', 0))
+        
+        if content_length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._send_json(413, {'error': 'request is too large'})
+            return
+        
+        body = self.rfile.read(content_length)
+        
+        if path != '/transform':
+            self._send_json(404, {'error': 'not found'})
+            return
+        
+        try:
+            req_data = json.loads(body.decode('utf-8', 'replace'))
+        except ValueError:
+            req_data = None
+        
+        if isinstance(req_data, dict) and isinstance(req_data.get('messages'), list) and \
+                all(isinstance(in_msg, str) for in_msg in req_data['messages']):
+            self._send_json(200, {
+                    'results': service.transform_many(req_data['messages']),
+                    })
+            return
+        
+        if isinstance(req_data, dict) and isinstance(req_data.get('message'), str):
+            self._send_json(200, service.transform_many((req_data['message'],))[0])
+            return
+        
+        self._send_json(400, {
+                'error': 'expected {"message": "..."} or {"messages": ["...", ...]}',
+                })
+
+class UnixServiceRequestHandler(ServiceRequestHandler):
+    # there is no Nagle's algorithm for Unix sockets
+    disable_nagle_algorithm = False
+
+class ServiceHttpServer(http_server.ThreadingHTTPServer):
+    request_queue_size = REQUEST_QUEUE_SIZE
+    daemon_threads = True
+
+class ServiceUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    request_queue_size = REQUEST_QUEUE_SIZE
+    daemon_threads = True
+
+class WorldNewsService:
+    # messages of all requests are transformed by one pool of ``conc``
+    # workers, with shared ``transformer`` (and its memo and shortener)
+    
+    def __init__(self, transformer, conc, stats_obj, short_cache_obj=None,
+            limiter=None):
+        self._transformer = transformer
+        self._stats = stats_obj
+        self._short_cache = short_cache_obj
+        self._limiter = limiter
+        self._executor = futures.ThreadPoolExecutor(max_workers=conc)
+    
+    def _transform(self, in_msg):
+        try:
+            result = self._transformer.transform(in_msg)
+        except Exception as e:
+            self._stats.count('messages', label=('result', 'error'))
+            self._stats.count('errors', label=('type', type(e).__name__))
+            
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+        
+        self._stats.count('messages', label=('result', 'pass'))
+        
+        return {'result': result}
+    
+    # threadsafe function
+    def transform_many(self, in_msg_list):
+        self._stats.count('requests')
+        
+        future_list = [
+                self._executor.submit(self._transform, in_msg)
+                for in_msg in in_msg_list
+                ]
+        
+        return [future.result() for future in future_list]
+    
+    def _update_stats(self):
+        memo = self._transformer.memo
+        
+        self._stats.set('memo_hits', memo.hit_count)
+        self._stats.set('memo_avoided_requests', memo.wait_count)
+        
+        if self._short_cache is not None:
+            self._stats.set('short_cache_hits', self._short_cache.hit_count)
+            self._stats.set('short_cache_misses', self._short_cache.miss_count)
+        
+        if self._limiter is not None:
+            self._stats.set('short_concurrency_limit', self._limiter.limit)
+    
+    # threadsafe function
+    def get_stats(self):
+        self._update_stats()
+        
+        return self._stats.to_dict()
+    
+    # threadsafe function
+    def get_prometheus(self):
+        self._update_stats()
+        
+        return self._stats.to_prometheus()
+    
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            prog='make-world-news serve',
+            description='local HTTP service of ``make-world-news``. '
+                    'configuration, workers and caches are kept between requests',
+            )
+    parser.add_argument(
+            '--host',
+            default=DEFAULT_HOST,
+            help='host to listen. default is {}'.format(DEFAULT_HOST),
+            )
+    parser.add_argument(
+            '--port',
+            type=int,
+            default=DEFAULT_PORT,
+            help='port to listen. default is {}'.format(DEFAULT_PORT),
+            )
+    parser.add_argument(
+            '--unix',
+            metavar='SOCKET-PATH',
+            help='listen Unix socket instead of TCP',
+            )
+    parser.add_argument(
+            '--use-short',
+            action='store_true',
+            help='use short links',
+            )
+    parser.add_argument(
+            '--conc',
+            metavar='CONCURRENCY',
+            type=int,
+            help='count of workers. default is {}'.format(
+                    make_world_news.DEFAULT_CONCURRENCY),
+            )
+    parser.add_argument(
+            '--max-conc',
+            metavar='MAX-CONCURRENCY',
+            type=int,
+            help='upper bound of adaptive limit of short link requests in flight. '
+                    'default is {} * CONCURRENCY'.format(
+                            adaptive_limit.DEFAULT_MAX_FACTOR),
+            )
+    parser.add_argument(
+            '--fixed-conc',
+            action='store_true',
+            help='do not adapt count of short link requests in flight to '
+                    'server load',
+            )
+    parser.add_argument(
+            'cfg',
+            metavar='CONFIG-PATH',
+            help='path to configuration file',
+            )
+    args = parser.parse_args(argv)
+    
+    if args.conc is not None and args.conc <= 0:
+        parser.error('CONCURRENCY must be positive')
+    if args.max_conc is not None and args.max_conc < (args.conc or 1):
+        parser.error('MAX-CONCURRENCY must not be less than CONCURRENCY')
+    
+    cfg, site_url, news_secret_key, other_word_func_factory = \
+            run_config.read_config(args.cfg)
+    
+    stats_obj = stats.Stats()
+    conc = args.conc if args.conc is not None else make_world_news.DEFAULT_CONCURRENCY
+    
+    if args.use_short and not args.fixed_conc:
+        limiter = run_config.create_limiter(cfg, 'threads', conc, args.max_conc)
+        conc = limiter.max_limit
+    else:
+        limiter = None
+    
+    if args.use_short:
+        short_func, short_pool = run_config.create_short_func(
+                cfg, site_url, 'threads', conc, limiter=limiter,
+                bucket=run_config.create_rate_limit(cfg), stats_obj=stats_obj)
+        short_cache_obj = run_config.create_short_cache(cfg, args.cfg)
+    else:
+        short_func = None
+        short_pool = None
+        short_cache_obj = None
+    
+    if short_cache_obj is not None:
+        short_func = short_cache.CachedShortener(short_func, short_cache_obj, site_url)
+    
+    transformer = message_transformer.MessageTransformer(
+            site_url,
+            news_secret_key,
+            use_short=args.use_short,
+            other_word_func_factory=other_word_func_factory,
+            short_func=short_func,
+            memo=url_memo.UrlMemo(),
+            stats=stats_obj,
+            )
+    service = WorldNewsService(
+            transformer,
+            conc,
+            stats_obj,
+            short_cache_obj=short_cache_obj,
+            limiter=limiter,
+            )
+    
+    if args.unix is not None:
+        if os.path.exists(args.unix):
+            # left by previous run
+            os.remove(args.unix)
+        
+        httpd = ServiceUnixServer(args.unix, UnixServiceRequestHandler)
+        address = args.unix
+    else:
+        httpd = ServiceHttpServer((args.host, args.port), ServiceRequestHandler)
+        address = 'http://{}:{}/'.format(*httpd.server_address[:2])
+    
+    httpd.service = service
+    
+    print('serving on {}'.format(address), flush=True)
+    
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+        
+        if args.unix is not None:
+            os.remove(args.unix)
+        
+        if short_pool is not None:
+            short_pool.close()
+        
+        if short_cache_obj is not None:
+            short_cache_obj.close()
@@ -0,0 +1,200 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, time, sqlite3
+from . import shortener
+
+DEFAULT_MAX_SIZE = 1000000 # items
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60 # seconds
+
+class ShortCache:
+    # persistent (sqlite) map ``(site_url, original_news_url) -> micro_news_url``.
+    # items older than ``max_age`` are not used; when there are more than
+    # ``max_size`` items, the oldest ones are evicted
+    
+    def __init__(self, path, max_size=None, max_age=None):
+        if max_size is None:
+            max_size = DEFAULT_MAX_SIZE
+        if max_age is None:
+            max_age = DEFAULT_MAX_AGE
+        
+        self._max_size = max_size
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._put_count = 0
+        self.hit_count = 0
+        self.miss_count = 0
+        
+        with self._lock, self._db:
+            self._db.execute('pragma journal_mode = wal')
+            self._db.execute('pragma synchronous = normal')
+            self._db.execute(
+                    'create table if not exists short_cache ('
+                    'site_url text not null, '
+                    'original_news_url text not null, '
+                    'micro_news_url text not null, '
+                    'created real not null, '
+                    'primary key (site_url, original_news_url))'
+                    )
+            self._db.execute(
+                    'create index if not exists short_cache_created '
+                    'on short_cache (created)'
+                    )
+        
+        self.evict()
+    
+    # threadsafe function
+    def get_many(self, site_url, original_news_url_list):
+        # returns dict ``original_news_url -> micro_news_url`` of found items
+        
+        min_created = time.time() - self._max_age
+        result = {}
+        
+        with self._lock:
+            for original_news_url in original_news_url_list:
+                row = self._db.execute(
+                        'select micro_news_url from short_cache '
+                        'where site_url = ? and original_news_url = ? and created >= ?',
+                        (site_url, original_news_url, min_created),
+                        ).fetchone()
+                
+                if row is not None:
+                    result[original_news_url] = row[0]
+            
+            self.hit_count += len(result)
+            self.miss_count += len(original_news_url_list) - len(result)
+        
+        return result
+    
+    # threadsafe function
+    def put_many(self, site_url, item_list):
+        # ``item_list`` is list of ``(original_news_url, micro_news_url)``
+        
+        created = time.time()
+        
+        with self._lock, self._db:
+            self._db.executemany(
+                    'insert or replace into short_cache '
+                    '(site_url, original_news_url, micro_news_url, created) '
+                    'values (?, ?, ?, ?)',
+                    (
+                            (site_url, original_news_url, micro_news_url, created)
+                            for original_news_url, micro_news_url in item_list
+                            ),
+                    )
+            
+            self._put_count += len(item_list)
+            need_evict = self._put_count >= max(self._max_size // 10, 1)
+        
+        if need_evict:
+            self.evict()
+    
+    # threadsafe function
+    def evict(self):
+        min_created = time.time() - self._max_age
+        
+        with self._lock, self._db:
+            self._put_count = 0
+            
+            self._db.execute(
+                    'delete from short_cache where created < ?',
+                    (min_created,),
+                    )
+            self._db.execute(
+                    'delete from short_cache where rowid in ('
+                    'select rowid from short_cache order by created desc '
+                    'limit -1 offset ?)',
+                    (self._max_size,),
+                    )
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class CachedShortener:
+    # wraps ``short_func``. items found in ``cache`` are not sent to network
+    
+    def __init__(self, short_func, cache, site_url):
+        self._short_func = short_func
+        self._cache = cache
+        self._site_url = site_url
+    
+    # threadsafe function
+    def __call__(self, original_news_url, news_key_b64):
+        return self.short_many(((original_news_url, news_key_b64),))[0]
+    
+    # threadsafe function
+    def short_many(self, item_list):
+        found = self._cache.get_many(
+                self._site_url,
+                [original_news_url for original_news_url, news_key_b64 in item_list],
+                )
+        miss_item_list = [item for item in item_list if item[0] not in found]
+        
+        if miss_item_list:
+            micro_news_url_list = shortener.short_many(self._short_func, miss_item_list)
+            new_item_list = [
+                    (original_news_url, micro_news_url)
+                    for (original_news_url, news_key_b64), micro_news_url
+                    in zip(miss_item_list, micro_news_url_list)
+                    if micro_news_url is not None
+                    ]
+            self._cache.put_many(self._site_url, new_item_list)
+            found.update(new_item_list)
+        
+        return [found.get(original_news_url) for original_news_url, news_key_b64 in item_list]
+
+class AsyncCachedShortener:
+    # asyncio variant of ``CachedShortener``. (sqlite is local and fast
+    # enough to be used directly from event loop)
+    
+    def __init__(self, short_func, cache, site_url):
+        self._short_func = short_func
+        self._cache = cache
+        self._site_url = site_url
+    
+    async def __call__(self, original_news_url, news_key_b64):
+        return (await self.short_many(((original_news_url, news_key_b64),)))[0]
+    
+    async def short_many(self, item_list):
+        found = self._cache.get_many(
+                self._site_url,
+                [original_news_url for original_news_url, news_key_b64 in item_list],
+                )
+        miss_item_list = [item for item in item_list if item[0] not in found]
+        
+        if miss_item_list:
+            micro_news_url_list = await self._short_func.short_many(miss_item_list)
+            new_item_list = [
+                    (original_news_url, micro_news_url)
+                    for (original_news_url, news_key_b64), micro_news_url
+                    in zip(miss_item_list, micro_news_url_list)
+                    if micro_news_url is not None
+                    ]
+            self._cache.put_many(self._site_url, new_item_list)
+            found.update(new_item_list)
+        
+        return [found.get(original_news_url) for original_news_url, news_key_b64 in item_list]
+    
+    async def close(self):
+        short_func_close = getattr(self._short_func, 'close', None)
+        
+        if short_func_close is not None:
+            await short_func_close()
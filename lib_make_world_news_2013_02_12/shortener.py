@@ -0,0 +1,254 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, asyncio, json
+from concurrent import futures
+from urllib import parse as url_parse
+from . import http_pool, aio_http
+
+DEFAULT_ASYNC_CONCURRENCY = 500
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_BATCH_DELAY = 0.05 # seconds
+
+# statuses of server, which does not know ``api/sh/new_batch``
+NO_BATCH_STATUSES = (404, 405, 501)
+
+def short_many(short_func, item_list):
+    # ``item_list`` is list of ``(original_news_url, news_key_b64)``.
+    # returns list of ``micro_news_url`` in the same order
+    
+    short_many_func = getattr(short_func, 'short_many', None)
+    
+    if short_many_func is not None:
+        return short_many_func(item_list)
+    
+    return [short_func(*item) for item in item_list]
+
+class Shortener:
+    # callable ``(original_news_url, news_key_b64) -> micro_news_url``.
+    # uses ``api/sh/new`` over keep-alive connections of ``pool``
+    
+    def __init__(self, site_url, pool=None, timeout=None):
+        if pool is None:
+            pool = http_pool.HttpPool()
+        
+        self._url = url_parse.urljoin(site_url, 'api/sh/new')
+        self._pool = pool
+        self._timeout = timeout
+    
+    # threadsafe function
+    def __call__(self, original_news_url, news_key_b64):
+        status, data = self._pool.request(
+                'POST',
+                self._url,
+                body=json.dumps({
+                        'original_news_url': original_news_url,
+                        'news_key': news_key_b64,
+                        }).encode(),
+                headers={'Content-Type': 'application/json;charset=utf-8'},
+                timeout=self._timeout,
+                )
+        if status != 200:
+            raise IOError('resp.getcode() != 200')
+        
+        sh_data = json.loads(data.decode('utf-8', 'replace'))
+        
+        return sh_data.get('micro_news_url')
+    
+    # threadsafe function
+    def short_many(self, item_list):
+        return [self(*item) for item in item_list]
+
+class AsyncShortener:
+    # asyncio variant of ``Shortener``. at most ``conc`` requests are in
+    # flight at once
+    
+    def __init__(self, site_url, pool=None, timeout=None, conc=None):
+        if pool is None:
+            pool = aio_http.AioHttpPool()
+        if conc is None:
+            conc = DEFAULT_ASYNC_CONCURRENCY
+        
+        self._url = url_parse.urljoin(site_url, 'api/sh/new')
+        self._pool = pool
+        self._timeout = timeout
+        self._conc = conc
+        self._sem = None
+    
+    async def __call__(self, original_news_url, news_key_b64):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self._conc)
+        
+        async with self._sem:
+            status, data = await self._pool.request(
+                    'POST',
+                    self._url,
+                    body=json.dumps({
+                            'original_news_url': original_news_url,
+                            'news_key': news_key_b64,
+                            }).encode(),
+                    headers={'Content-Type': 'application/json;charset=utf-8'},
+                    timeout=self._timeout,
+                    )
+        
+        if status != 200:
+            raise IOError('resp.getcode() != 200')
+        
+        sh_data = json.loads(data.decode('utf-8', 'replace'))
+        
+        return sh_data.get('micro_news_url')
+    
+    async def short_many(self, item_list):
+        return await asyncio.gather(*(self(*item) for item in item_list))
+    
+    async def close(self):
+        await self._pool.close()
+
+class BatchShortener:
+    # collects pending items across messages (and across threads), and sends
+    # them by one ``api/sh/new_batch`` request, when ``batch_size`` items is
+    # collected or when ``batch_delay`` is expired.
+    #
+    # falls back to ``api/sh/new`` per item, if server does not support batches
+    
+    def __init__(self, site_url, pool=None, timeout=None,
+            batch_size=None, batch_delay=None):
+        if pool is None:
+            pool = http_pool.HttpPool()
+        if batch_size is None:
+            batch_size = DEFAULT_BATCH_SIZE
+        if batch_delay is None:
+            batch_delay = DEFAULT_BATCH_DELAY
+        
+        assert batch_size > 0
+        
+        self._single = Shortener(site_url, pool=pool, timeout=timeout)
+        self._url = url_parse.urljoin(site_url, 'api/sh/new_batch')
+        self._pool = pool
+        self._timeout = timeout
+        self._batch_size = batch_size
+        self._batch_delay = batch_delay
+        self._batch_supported = True
+        self._lock = threading.Lock()
+        self._pending = []
+    
+    @property
+    def batch_supported(self):
+        return self._batch_supported
+    
+    # threadsafe function
+    def __call__(self, original_news_url, news_key_b64):
+        return self.short_many(((original_news_url, news_key_b64),))[0]
+    
+    # threadsafe function
+    def short_many(self, item_list):
+        if not self._batch_supported:
+            return self._single.short_many(item_list)
+        
+        future_list = []
+        batch_list = []
+        
+        with self._lock:
+            for original_news_url, news_key_b64 in item_list:
+                future = futures.Future()
+                future_list.append(future)
+                self._pending.append((original_news_url, news_key_b64, future))
+                
+                if len(self._pending) >= self._batch_size:
+                    batch_list.append(self._pending)
+                    self._pending = []
+        
+        for batch in batch_list:
+            self._send(batch)
+        
+        for future in future_list:
+            while not future.done():
+                done, not_done = futures.wait((future,), timeout=self._batch_delay)
+                
+                if not_done:
+                    # nobody has sent our items yet. sending them by ourself
+                    self._flush()
+        
+        return [future.result() for future in future_list]
+    
+    def _flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+        
+        for i in range(0, len(pending), self._batch_size):
+            self._send(pending[i:i + self._batch_size])
+    
+    def _send(self, batch):
+        if self._batch_supported:
+            try:
+                micro_news_url_list = self._send_batch(batch)
+            except Exception as e:
+                for original_news_url, news_key_b64, future in batch:
+                    future.set_exception(e)
+                
+                return
+            
+            if micro_news_url_list is not None:
+                for item, micro_news_url in zip(batch, micro_news_url_list):
+                    original_news_url, news_key_b64, future = item
+                    future.set_result(micro_news_url)
+                
+                return
+        
+        for original_news_url, news_key_b64, future in batch:
+            try:
+                micro_news_url = self._single(original_news_url, news_key_b64)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(micro_news_url)
+    
+    def _send_batch(self, batch):
+        # returns ``None`` if batches are not supported
+        
+        status, data = self._pool.request(
+                'POST',
+                self._url,
+                body=json.dumps({
+                        'items': [
+                                {
+                                        'original_news_url': original_news_url,
+                                        'news_key': news_key_b64,
+                                        }
+                                for original_news_url, news_key_b64, future in batch
+                                ],
+                        }).encode(),
+                headers={'Content-Type': 'application/json;charset=utf-8'},
+                timeout=self._timeout,
+                )
+        if status in NO_BATCH_STATUSES:
+            self._batch_supported = False
+            
+            return None
+        if status != 200:
+            raise IOError('resp.getcode() != 200')
+        
+        sh_data = json.loads(data.decode('utf-8', 'replace'))
+        sh_item_list = sh_data.get('items')
+        
+        if not isinstance(sh_item_list, list) or len(sh_item_list) != len(batch):
+            raise IOError('invalid batch response')
+        
+        return [sh_item.get('micro_news_url') for sh_item in sh_item_list]
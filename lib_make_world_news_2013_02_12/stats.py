@@ -0,0 +1,277 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, asyncio, time, bisect, json, os
+from . import http_pool
+
+PROMETHEUS_PREFIX = 'make_world_news_'
+DEFAULT_PROMETHEUS_INTERVAL = 10.0 # seconds
+
+# upper bounds of latency histogram buckets (seconds)
+DEFAULT_BUCKETS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0,
+        float('inf'),
+        )
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+def _format_le(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    
+    return repr(bound)
+
+def _write_file(path, text):
+    # readers (monitoring, ...) never see half-written file
+    
+    tmp_path = '{}.tmp'.format(path)
+    
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as fd:
+        fd.write(text)
+    
+    os.replace(tmp_path, path)
+
+class Stats:
+    # counters, gauges and latency histograms of one run.
+    #
+    # each metric may have one label, given as ``(label_name, label_value)``.
+    # counter ``stage_seconds`` (labeled by ``stage``) is time spent in each
+    # stage of processing
+    
+    def __init__(self, buckets=None):
+        if buckets is None:
+            buckets = DEFAULT_BUCKETS
+        
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._start_time = time.monotonic()
+        self._counter_map = {}
+        self._gauge_map = {}
+        self._histogram_map = {}
+    
+    # threadsafe function
+    def count(self, name, value=None, label=None):
+        if value is None:
+            value = 1
+        
+        key = name, label
+        
+        with self._lock:
+            self._counter_map[key] = self._counter_map.get(key, 0) + value
+    
+    # threadsafe function
+    def count_many(self, item_list):
+        # ``item_list`` is list of ``(name, value, label)``. one lock for all
+        
+        with self._lock:
+            for name, value, label in item_list:
+                key = name, label
+                self._counter_map[key] = self._counter_map.get(key, 0) + value
+    
+    # threadsafe function
+    def add_time(self, stage, seconds):
+        self.count('stage_seconds', seconds, label=('stage', stage))
+    
+    # threadsafe function
+    def set(self, name, value, label=None):
+        with self._lock:
+            self._gauge_map[name, label] = value
+    
+    # threadsafe function
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histogram_map.get(name)
+            
+            if histogram is None:
+                histogram = self._histogram_map[name] = _Histogram(self._buckets)
+            
+            histogram.observe(seconds)
+    
+    # threadsafe function
+    def to_dict(self):
+        def put_value(result, key, value):
+            name, label = key
+            
+            if label is None:
+                result[name] = value
+            else:
+                result.setdefault(name, {})[label[1]] = value
+        
+        with self._lock:
+            counters = {}
+            gauges = {}
+            histograms = {}
+            
+            for key, value in self._counter_map.items():
+                put_value(counters, key, value)
+            
+            for key, value in self._gauge_map.items():
+                put_value(gauges, key, value)
+            
+            for name, histogram in self._histogram_map.items():
+                histograms[name] = {
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'buckets': [
+                                [_format_le(bound), bucket_count]
+                                for bound, bucket_count
+                                in zip(histogram.buckets, histogram.bucket_counts)
+                                ],
+                        }
+            
+            return {
+                    'elapsed_seconds': time.monotonic() - self._start_time,
+                    'counters': counters,
+                    'gauges': gauges,
+                    'histograms': histograms,
+                    }
+    
+    # threadsafe function
+    def to_prometheus(self):
+        line_list = []
+        type_set = set()
+        
+        def put_lines(key, value, metric_type):
+            name, label = key
+            name = '{}{}'.format(PROMETHEUS_PREFIX, name)
+            
+            if metric_type == 'counter':
+                name = '{}_total'.format(name)
+            
+            if label is None:
+                label_text = ''
+            else:
+                label_text = '{{{}="{}"}}'.format(
+                        label[0],
+                        str(label[1]).replace('\\', '\\\\').replace('"', '\\"'),
+                        )
+            
+            if name not in type_set:
+                type_set.add(name)
+                line_list.append('# TYPE {} {}'.format(name, metric_type))
+            
+            line_list.append('{}{} {!r}'.format(name, label_text, value))
+        
+        with self._lock:
+            line_list.append('# TYPE {}elapsed_seconds gauge'.format(PROMETHEUS_PREFIX))
+            line_list.append('{}elapsed_seconds {!r}'.format(
+                    PROMETHEUS_PREFIX, time.monotonic() - self._start_time))
+            
+            for key, value in sorted(self._counter_map.items(), key=repr):
+                put_lines(key, value, 'counter')
+            
+            for key, value in sorted(self._gauge_map.items(), key=repr):
+                put_lines(key, value, 'gauge')
+            
+            for name, histogram in sorted(self._histogram_map.items()):
+                name = '{}{}'.format(PROMETHEUS_PREFIX, name)
+                cumulative = 0
+                
+                line_list.append('# TYPE {} histogram'.format(name))
+                
+                for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    line_list.append('{}_bucket{{le="{}"}} {}'.format(
+                            name, _format_le(bound), cumulative))
+                
+                line_list.append('{}_sum {!r}'.format(name, histogram.sum))
+                line_list.append('{}_count {}'.format(name, histogram.count))
+        
+        return ''.join('{}\n'.format(line) for line in line_list)
+    
+    def write_json(self, path):
+        _write_file(path, '{}\n'.format(
+                json.dumps(self.to_dict(), indent=4, sort_keys=True)))
+    
+    def write_prometheus(self, path):
+        _write_file(path, self.to_prometheus())
+
+class TimedPool:
+    # wraps ``http_pool.HttpPool``. latency of each request is observed by
+    # ``stats`` (histogram ``short_request_seconds``)
+    
+    def __init__(self, pool, stats):
+        self._pool = pool
+        self._stats = stats
+    
+    # threadsafe function
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        start_time = time.perf_counter()
+        status = 'error'
+        
+        try:
+            status, data = self._pool.request(
+                    method, url, body=body, headers=headers, timeout=timeout)
+            
+            return status, data
+        except http_pool.Aborted:
+            # cancel of run is not latency of server
+            status = 'aborted'
+            
+            raise
+        finally:
+            if status != 'aborted':
+                self._stats.observe(
+                        'short_request_seconds', time.perf_counter() - start_time)
+            
+            self._stats.count('short_requests', label=('status', status))
+    
+    def close(self):
+        self._pool.close()
+
+class AsyncTimedPool:
+    # asyncio variant of ``TimedPool``, wraps ``aio_http.AioHttpPool``
+    
+    def __init__(self, pool, stats):
+        self._pool = pool
+        self._stats = stats
+    
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        start_time = time.perf_counter()
+        status = 'error'
+        
+        try:
+            status, data = await self._pool.request(
+                    method, url, body=body, headers=headers, timeout=timeout)
+            
+            return status, data
+        except asyncio.CancelledError:
+            # cancel of run is not latency of server
+            status = 'aborted'
+            
+            raise
+        finally:
+            if status != 'aborted':
+                self._stats.observe(
+                        'short_request_seconds', time.perf_counter() - start_time)
+            
+            self._stats.count('short_requests', label=('status', status))
+    
+    async def close(self):
+        await self._pool.close()
@@ -0,0 +1,190 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright 2013 Andrej A Antonov <polymorphm@gmail.com>.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+assert str is not bytes
+
+import threading, asyncio, collections
+from . import shortener
+
+DEFAULT_MAX_SIZE = 100000 # items
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.news_url = None
+        self.error = None
+
+class UrlMemo:
+    # per-run memo ``original_news_url -> news_url``.
+    #
+    # ``short_many()`` is single-flight: when url is already being shortened
+    # by other worker, we wait for its result instead of sending duplicate
+    # request
+    
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = DEFAULT_MAX_SIZE
+        
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._done_map = collections.OrderedDict()
+        self._flight_map = {}
+        self._aio_flight_map = {}
+        self.hit_count = 0
+        self.wait_count = 0
+    
+    # threadsafe function
+    def get(self, original_news_url):
+        with self._lock:
+            news_url = self._done_map.get(original_news_url)
+            
+            if news_url is not None:
+                self.hit_count += 1
+                self._done_map.move_to_end(original_news_url)
+            
+            return news_url
+    
+    def _put(self, original_news_url, news_url):
+        if news_url is None:
+            return
+        
+        self._done_map[original_news_url] = news_url
+        self._done_map.move_to_end(original_news_url)
+        
+        while len(self._done_map) > self._max_size:
+            self._done_map.popitem(last=False)
+    
+    # threadsafe function
+    def put(self, original_news_url, news_url):
+        with self._lock:
+            self._put(original_news_url, news_url)
+    
+    def _claim(self, item_list, flight_map, flight_factory):
+        # returns ``(found, own_item_list, own_flight_list, wait_list)``
+        
+        found = {}
+        own_item_list = []
+        own_flight_list = []
+        wait_list = []
+        seen = set()
+        
+        for item in item_list:
+            original_news_url = item[0]
+            
+            if original_news_url in seen:
+                continue
+            
+            seen.add(original_news_url)
+            
+            news_url = self._done_map.get(original_news_url)
+            
+            if news_url is not None:
+                self.hit_count += 1
+                found[original_news_url] = news_url
+                continue
+            
+            flight = flight_map.get(original_news_url)
+            
+            if flight is not None:
+                self.wait_count += 1
+                wait_list.append((original_news_url, flight))
+                continue
+            
+            flight = flight_factory()
+            flight_map[original_news_url] = flight
+            own_item_list.append(item)
+            own_flight_list.append(flight)
+        
+        return found, own_item_list, own_flight_list, wait_list
+    
+    # threadsafe function
+    def short_many(self, short_func, item_list):
+        with self._lock:
+            found, own_item_list, own_flight_list, wait_list = \
+                    self._claim(item_list, self._flight_map, _Flight)
+        
+        if own_item_list:
+            try:
+                micro_news_url_list = shortener.short_many(short_func, own_item_list)
+            except BaseException as e:
+                with self._lock:
+                    for item, flight in zip(own_item_list, own_flight_list):
+                        del self._flight_map[item[0]]
+                        flight.error = e
+                        flight.event.set()
+                
+                raise
+            
+            with self._lock:
+                for item, flight, micro_news_url in \
+                        zip(own_item_list, own_flight_list, micro_news_url_list):
+                    del self._flight_map[item[0]]
+                    self._put(item[0], micro_news_url)
+                    flight.news_url = micro_news_url
+                    flight.event.set()
+                    found[item[0]] = micro_news_url
+        
+        for original_news_url, flight in wait_list:
+            flight.event.wait()
+            
+            if flight.error is not None:
+                raise flight.error
+            
+            found[original_news_url] = flight.news_url
+        
+        return [found[item[0]] for item in item_list]
+    
+    async def async_short_many(self, short_func, item_list):
+        # asyncio variant of ``short_many()``. must be used inside one
+        # event loop
+        
+        loop = asyncio.get_running_loop()
+        
+        with self._lock:
+            found, own_item_list, own_flight_list, wait_list = \
+                    self._claim(item_list, self._aio_flight_map, loop.create_future)
+        
+        if own_item_list:
+            try:
+                micro_news_url_list = await short_func.short_many(own_item_list)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    # for example, ``asyncio.CancelledError``
+                    e = IOError('shortening is interrupted')
+                
+                with self._lock:
+                    for item, flight in zip(own_item_list, own_flight_list):
+                        del self._aio_flight_map[item[0]]
+                        flight.set_exception(e)
+                        # waiters (if any) will retrieve exception. but
+                        # without waiters it must not be reported as lost
+                        flight.exception()
+                
+                raise
+            
+            with self._lock:
+                for item, flight, micro_news_url in \
+                        zip(own_item_list, own_flight_list, micro_news_url_list):
+                    del self._aio_flight_map[item[0]]
+                    self._put(item[0], micro_news_url)
+                    flight.set_result(micro_news_url)
+                    found[item[0]] = micro_news_url
+        
+        for original_news_url, flight in wait_list:
+            found[original_news_url] = await flight
+        
+        return [found[item[0]] for item in item_list]